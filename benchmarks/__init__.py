@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Microbenchmarks for the pachinkoagentic execution path.  Run from the repository root, e.g.
+  python -m benchmarks.line_attribution
+"""
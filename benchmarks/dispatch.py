@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Measures the per workflow setup cost and retained memory of Library.mcp_wrapper for a library of in-memory
+  fastmcp servers.
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+from .fakes import fake_library
+
+async def main(servers: int = 10, tools: int = 20, runs: int = 1000) -> None:
+    library = fake_library(servers * tools, tools)
+    await library.refresh()
+    names = list(library.capabilities)
+    start = time.perf_counter()
+    for i in range(runs):
+        runner = library.mcp_wrapper(None, str(i))
+        for name in names:
+            getattr(runner, name)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    live = []
+    for i in range(runs):
+        runner = library.mcp_wrapper(None, str(i))
+        for name in names:
+            getattr(runner, name)
+        live.append(runner)
+    retained = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, 'filename'))
+    tracemalloc.stop()
+    print(f'{servers} servers x {tools} tools: {1e6 * elapsed / runs:.1f} us setup/run, {retained / runs / 1024:.1f} KiB retained/run')
+    await library.close()
+    return
+
+if __name__ == '__main__':
+    asyncio.run(main(*[int(arg) for arg in sys.argv[1:]]))
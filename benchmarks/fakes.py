@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+In-process stand ins for the benchmarks: fastmcp servers with a configurable number of tools and latency, and a
+  deterministic AIWrapper that answers every prompt with a canned plan.
+"""
+
+import asyncio
+from typing import Generator
+from fastmcp import FastMCP
+import pachinkoagentic
+from pachinkoagentic.AIWrapper import AIWrapper, AIResponse
+
+def fake_server(name: str, tools: int, latency: float = 0.0) -> FastMCP:
+    server = FastMCP(name, instructions=f'{name} benchmark server')
+    for i in range(tools):
+        async def tool(a: int, b: int) -> int:
+            if latency > 0:
+                await asyncio.sleep(latency)
+            return a + b
+        server.tool(tool, name=f'tool{i}', description=f'Benchmark tool {i}')
+    return server
+
+def fake_library(tools: int, tools_per_server: int = 50, latency: float = 0.0, **library_options) -> pachinkoagentic.Library:
+    library = pachinkoagentic.Library(**library_options)
+    for i, start in enumerate(range(0, tools, tools_per_server)):
+        library.add(library.client(fake_server(f'Server{i}', min(tools_per_server, tools - start), latency), mode='legacy'))
+    return library
+
+def fake_plan(library: pachinkoagentic.Library, calls: int = 4) -> str:
+    # fans out over the first tools of the library, gathers them and outputs the sum
+    targets = [(server, cap.name) for server in library.capabilities for cap in library.capabilities[server]['capabilities']][:calls]
+    targets = (targets * calls)[:calls]
+    lines = ['async def FUNCNAME(MCP: object):']
+    lines += [f'    c{i} = MCP.{server}.{tool}(a={i}, b=1)' for i, (server, tool) in enumerate(targets)]
+    lines += [f'    results = await MCP.Wait({", ".join(f"c{i}" for i in range(len(targets)))})',
+              '    await MCP.Output(str(sum(results)))']
+    return '\n'.join(lines)
+
+class ScriptedAIWrapper(AIWrapper):
+    def __init__(self, plan: str, latency: float = 0.0, chunk_size: int = 32):
+        self.plan = plan
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+        pass
+    def answer(self, system_prompt: str) -> str:
+        # the generator prompt names the function it expects, samples get an HTML answer
+        if 'async def ' in system_prompt:
+            funcname = system_prompt.split('async def ')[1].split('(')[0]
+            return f'[PYTHON BEGINS]\n{self.plan.replace("FUNCNAME", funcname)}\n[PYTHON ENDS]'
+        return '[STARTANSWER]\nscripted answer\n[ENDANSWER]'
+    async def get_response(self, system_prompt: str, question:str, include_thinking: bool=False) -> AIResponse:
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        answer = self.answer(system_prompt)
+        return AIResponse(answer=answer, thought='', prompt_token_use=len(system_prompt) // 4, completion_token_use=len(answer) // 4, duration=self.latency)
+    async def get_streaming_response(self, system_prompt: str, question:str, include_thinking: bool=False) -> Generator[str, None, None]:
+        self.calls += 1
+        answer = self.answer(system_prompt)
+        for start in range(0, len(answer), self.chunk_size):
+            if self.latency > 0:
+                await asyncio.sleep(self.latency * self.chunk_size / len(answer))
+            yield answer[start:start + self.chunk_size]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Measures Flowchart build (parse + dependency layout + markup) and SVG render time for synthetic plans of
+  increasing size.  finish() lays the chart out and formats every symbol once, so that cost is part of the
+  build and is also reported on its own as layout.  Renders reuse the markup and only fill in the colours.
+"""
+
+import asyncio
+import sys
+import time
+from pachinkoagentic.Flowchart import Flowchart
+
+def synthetic_plan(statements: int) -> str:
+    lines = ['async def PACHINKO_AGENTIC_WORKFLOW(MCP: object):']
+    for i in range(0, statements, 6):
+        lines += [f'    a{i} = MCP.Server{i % 7}.tool{i % 5}(value={i})',
+                  f'    b{i} = MCP.Server{i % 3}.tool{i % 4}(value={i})',
+                  f'    r{i}, s{i} = await MCP.Wait(a{i}, b{i})',
+                  f'    for item in r{i}:',
+                  f'        await MCP.Server1.tool2(value=item, other=s{i})',
+                  f'    await MCP.Output(f"{{r{i}}}")']
+    return '\n'.join(lines)
+
+async def main(repeats: int = 100) -> None:
+    for statements in (60, 300, 1200):
+        code = synthetic_plan(statements)
+        built = 0.0
+        first = 0.0
+        laid_out = 0.0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            flowchart = await Flowchart().from_code('benchmark', code)
+            built += time.perf_counter() - start
+            start = time.perf_counter()
+            svg = await flowchart.svg()
+            first += time.perf_counter() - start
+            start = time.perf_counter()
+            flowchart.layout()
+            laid_out += time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeats):
+            await flowchart.svg()
+        again = time.perf_counter() - start
+        heatmap = {lineno: float(lineno % 17) for lineno in range(1, statements + 2)}
+        start = time.perf_counter()
+        for _ in range(repeats):
+            await flowchart.svg(heatmap=heatmap)
+        heated = time.perf_counter() - start
+        symbols = sum(len(row) for row in flowchart.rows)
+        print(f'{statements:5d} lines, {symbols:4d} symbols: build {1e6 * built / repeats:8.1f} us (layout {1e6 * laid_out / repeats:7.1f} us), render first {1e6 * first / repeats:7.1f} us, '
+              f'again {1e6 * again / repeats:6.1f} us, heatmap {1e6 * heated / repeats:7.1f} us, {len(svg)} bytes')
+    return
+
+if __name__ == '__main__':
+    asyncio.run(main(*[int(arg) for arg in sys.argv[1:]]))
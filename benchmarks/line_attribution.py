@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Measures the per event overhead of line attribution in MCPWrapper.Output at increasing call stack depths.
+"""
+
+import asyncio
+import sys
+import time
+import pachinkoagentic
+from pachinkoagentic.MCPWrapper import MCPWrapper
+
+async def drain(runner: MCPWrapper, expected: int) -> None:
+    count = 0
+    async for event in runner.event_stream:
+        count += 1
+        if count == expected:
+            break
+    return
+
+async def nested(depth: int, runner: MCPWrapper, calls: int) -> None:
+    if depth > 0:
+        return await nested(depth - 1, runner, calls)
+    for _ in range(calls):
+        await runner.Output('x')
+    return
+
+async def per_event(depth: int, calls: int) -> float:
+    runner = MCPWrapper(None, 'benchmark')
+    consumer = asyncio.ensure_future(drain(runner, 3 * calls))
+    start = time.perf_counter()
+    await nested(depth, runner, calls)
+    await consumer
+    return (time.perf_counter() - start) / (3 * calls)
+
+async def main(calls: int = 2000) -> None:
+    for depth in [0, 25, 100]:
+        print(f'depth={depth:4d}  {1e6 * await per_event(depth, calls):8.2f} us/event')
+    return
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Compares the bytes per run of the verbose WORKFLOW_UPDATE events against the NODE_STATE deltas for the same
+  plan run against in-memory fastmcp servers.
+"""
+
+import asyncio
+import json
+import sys
+from pachinkoagentic.Flowchart import Flowchart, Call, Junction
+from pachinkoagentic.WorkflowEvent import WorkflowEventType
+from .fakes import fake_library
+
+PLAN = '''async def PACHINKO_AGENTIC_WORKFLOW(MCP: object):
+    a = MCP.Server0.tool0(a=1, b=2)
+    b = MCP.Server1.tool1(a=3, b=4)
+    x, y = await MCP.Wait(a, b)
+    total = 0
+    for i in range(LOOPS):
+        total += await MCP.Server2.tool2(a=x, b=i)
+    await MCP.Output(f'{total}')
+'''
+
+async def main(loops: int = 20) -> None:
+    library = fake_library(9, 3)
+    await library.refresh()
+    code = PLAN.replace('LOOPS', str(loops))
+    flowchart = await Flowchart().from_code('benchmark', code)
+    nodes = sorted({symbol.lineno for row in flowchart.rows for symbol in row if isinstance(symbol, (Call, Junction))})
+    sizes = {}
+    runner = library.mcp_wrapper(None, 'benchmark', node_updates=True)
+    execution = asyncio.ensure_future(runner.exec_agentic_function('PACHINKO_AGENTIC_WORKFLOW', code, nodes))
+    async for event in runner.event_stream:
+        count, size, payload = sizes.get(event.event_type, (0, 0, 0))
+        sizes[event.event_type] = (count + 1,
+                                   size + len(json.dumps({'event_type': event.event_type, 'workflow_id': event.workflow_id, 'extra_data': event.extra_data})),
+                                   payload + len(json.dumps(event.extra_data)))
+        if event.event_type == WorkflowEventType.WORKFLOW_END:
+            break
+    await execution
+    for event_type in (WorkflowEventType.WORKFLOW_UPDATE, WorkflowEventType.NODE_STATE):
+        count, size, payload = sizes.get(event_type, (0, 0, 0))
+        print(f'{event_type:16s} {count:4d} events {size:7d} bytes, {payload:7d} bytes of extra_data ({payload / max(count, 1):.0f} bytes/event)')
+    await library.close()
+    return
+
+if __name__ == '__main__':
+    asyncio.run(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Hermetic benchmark suite for the package's own overhead.  Everything runs in process against in-memory fastmcp
+  servers and a scripted AIWrapper, so no MCP server or LLM is needed and the numbers are repeatable.
+
+    python -m benchmarks.suite [--quick] [--latency SECONDS] [--output results.json]
+
+Each result is one JSON record of the benchmark name, its parameters and its timings so that runs can be diffed
+  for regressions.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+import pachinkoagentic
+from pachinkoagentic.Flowchart import Flowchart
+from pachinkoagentic.WorkflowEvent import WorkflowEvent, WorkflowEventType, WorkflowEventStream
+from .fakes import fake_library, fake_plan, ScriptedAIWrapper
+from .flowchart import synthetic_plan
+
+QUESTION = 'Add up the benchmark numbers.'
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {'n': len(samples), 'mean': statistics.fmean(samples), 'min': samples[0],
+            'p50': samples[len(samples) // 2], 'p95': samples[int(0.95 * (len(samples) - 1))], 'max': samples[-1]}
+
+async def loaded_library(tools: int, latency: float = 0.0) -> pachinkoagentic.Library:
+    library = fake_library(tools, latency=latency)
+    with contextlib.redirect_stdout(io.StringIO()): # Capabilities print every schema they parse
+        await library.refresh()
+    return library
+
+async def bench_library(tools: int, repeats: int) -> list:
+    results = []
+    cold = []
+    warm = []
+    for _ in range(repeats):
+        library = fake_library(tools)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            await library.reload()
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await library.reload()
+            warm.append(time.perf_counter() - start)
+        await library.close()
+    results.append({'benchmark': 'library.reload', 'tools': tools, 'catalog': 'new', 'seconds': summarize(cold)})
+    results.append({'benchmark': 'library.reload', 'tools': tools, 'catalog': 'unchanged', 'seconds': summarize(warm)})
+    library = await loaded_library(tools)
+    start = time.perf_counter()
+    docs = library.swagger_docs()
+    cold = time.perf_counter() - start
+    warm = []
+    for _ in range(repeats * 10):
+        start = time.perf_counter()
+        library.swagger_docs()
+        warm.append(time.perf_counter() - start)
+    results.append({'benchmark': 'library.swagger_docs', 'tools': tools, 'cache': 'cold', 'chars': len(docs), 'seconds': summarize([cold])})
+    results.append({'benchmark': 'library.swagger_docs', 'tools': tools, 'cache': 'warm', 'chars': len(docs), 'seconds': summarize(warm)})
+    await library.close()
+    return results
+
+async def bench_generate(tools: int, repeats: int) -> list:
+    library = await loaded_library(tools)
+    generator = ScriptedAIWrapper(fake_plan(library))
+    samples = []
+    for i in range(repeats):
+        workflow = pachinkoagentic.Workflow(generator, generator, library, f'generate{i}')
+        start = time.perf_counter()
+        async for event in workflow.generate(QUESTION):
+            pass
+        samples.append(time.perf_counter() - start)
+    await library.close()
+    return [{'benchmark': 'workflow.generate', 'tools': tools, 'seconds': summarize(samples)}]
+
+async def run_workflow(library: pachinkoagentic.Library, generator: ScriptedAIWrapper, workflow_id: str) -> tuple[float, float, int]:
+    workflow = pachinkoagentic.Workflow(generator, generator, library, workflow_id)
+    start = time.perf_counter()
+    async for event in workflow.generate(QUESTION):
+        if event.event_type == WorkflowEventType.WORKFLOW_GENERATION_FAILED:
+            raise RuntimeError(event.extra_data)
+    generated = time.perf_counter()
+    events = 0
+    async for event in workflow.process():
+        events += 1
+    return generated - start, time.perf_counter() - generated, events
+
+async def bench_concurrency(concurrency: int, tools: int, latency: float) -> list:
+    library = await loaded_library(tools, latency)
+    generator = ScriptedAIWrapper(fake_plan(library))
+    start = time.perf_counter()
+    runs = await asyncio.gather(*[run_workflow(library, generator, f'run{i}') for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    await library.close()
+    return [{'benchmark': 'workflow.generate', 'tools': tools, 'concurrency': concurrency, 'seconds': summarize([run[0] for run in runs])},
+            {'benchmark': 'workflow.process', 'tools': tools, 'concurrency': concurrency, 'tool_latency': latency,
+             'seconds': summarize([run[1] for run in runs]), 'events': sum(run[2] for run in runs),
+             'wall': elapsed, 'workflows_per_second': concurrency / elapsed}]
+
+async def bench_events(count: int) -> list:
+    results = []
+    for mode in ('iterate', 'batches'):
+        stream = WorkflowEventStream()
+        event = WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_UPDATE, workflow_id='events', extra_data={'line': 1, 'update': ''})
+        async def produce():
+            for _ in range(count):
+                await stream.put(event)
+            await stream.stop()
+            return
+        received = 0
+        start = time.perf_counter()
+        producer = asyncio.ensure_future(produce())
+        if mode == 'iterate':
+            async for _ in stream:
+                received += 1
+        else:
+            async for batch in stream.batches():
+                received += len(batch)
+        await producer
+        elapsed = time.perf_counter() - start
+        results.append({'benchmark': 'event_stream', 'mode': mode, 'events': received, 'seconds': elapsed, 'events_per_second': received / elapsed})
+    return results
+
+async def bench_flowchart(statements: int, repeats: int) -> list:
+    code = synthetic_plan(statements)
+    heatmap = {lineno: float(lineno % 17) for lineno in range(1, statements + 2)}
+    built = []
+    laid_out = []
+    rendered = []
+    heated = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        flowchart = await Flowchart().from_code('benchmark', code)
+        built.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        flowchart.layout()
+        laid_out.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await flowchart.svg()
+        rendered.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await flowchart.svg(heatmap=heatmap)
+        heated.append(time.perf_counter() - start)
+    return [{'benchmark': 'flowchart.build', 'statements': statements, 'seconds': summarize(built)},
+            {'benchmark': 'flowchart.layout', 'statements': statements, 'seconds': summarize(laid_out)},
+            {'benchmark': 'flowchart.svg', 'statements': statements, 'render': 'first', 'seconds': summarize(rendered)},
+            {'benchmark': 'flowchart.svg', 'statements': statements, 'render': 'heatmap', 'seconds': summarize(heated)}]
+
+def report(result: dict) -> None:
+    params = ' '.join(f'{key}={value}' for key, value in result.items() if key not in ('benchmark', 'seconds') and not isinstance(value, float))
+    seconds = result['seconds']
+    timing = f'mean {1e3 * seconds["mean"]:9.3f} ms  p95 {1e3 * seconds["p95"]:9.3f} ms' if isinstance(seconds, dict) else f'{1e3 * seconds:9.3f} ms'
+    rate = ''.join(f'  {value:,.0f} {key.replace("_per_", "/")}' for key, value in result.items() if key.endswith('_per_second'))
+    print(f'{result["benchmark"]:22s} {params:45s} {timing}{rate}', file=sys.stderr)
+    return
+
+async def main(quick: bool = False, latency: float = 0.0, output: str | None = None) -> list:
+    pachinkoagentic.quiet_spammers([name for name in logging.root.manager.loggerDict if name.startswith('pachinkoagentic')])
+    tool_scales = (1, 10, 100) if quick else (1, 10, 100, 500)
+    concurrencies = (1, 10, 100) if quick else (1, 10, 100, 1000)
+    repeats = 3 if quick else 10
+    results = []
+    benchmarks = [bench_library(tools, repeats) for tools in tool_scales]
+    benchmarks += [bench_generate(tools, repeats) for tools in tool_scales]
+    benchmarks += [bench_concurrency(concurrency, 10, latency) for concurrency in concurrencies]
+    benchmarks += [bench_events(10000 if quick else 100000)]
+    benchmarks += [bench_flowchart(statements, repeats) for statements in ((60, 300) if quick else (60, 300, 1200))]
+    for benchmark in benchmarks:
+        for result in await benchmark:
+            report(result)
+            results.append(result)
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'quick': quick, 'tool_latency': latency,
+                       'timestamp': time.time(), 'results': results}, f, indent=1)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hermetic pachinkoagentic benchmark suite.')
+    parser.add_argument('--quick', action='store_true', help='smaller scales and fewer repeats')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each fake tool call sleeps')
+    parser.add_argument('--output', default=None, help='write the results as JSON to this file')
+    args = parser.parse_args()
+    asyncio.run(main(args.quick, args.latency, args.output))
@@ -6,6 +6,7 @@ Because of the various LM protocols, this is a simple wrapped interface.
 This allows functional consistency whether you are going to Ollama, VLLM, or any of the commercial LLMs.
 """
 
+import asyncio
 from abc import ABC, abstractclassmethod
 from dataclasses import dataclass
 from typing import Generator
@@ -19,10 +20,13 @@ class AIResponse:
     duration: float
     
 class AIWrapper(ABC):
+    # backends that can send many prompts as one request set this and override get_batch_responses
+    supports_batch = False
     @abstractclassmethod
     async def get_response(cls, system_prompt: str, question:str, include_thinking: bool=False) -> AIResponse:
         ...
     @abstractclassmethod
     async def get_streaming_response(cls, system_prompt: str, question:str, include_thinking: bool=False) -> Generator[str, None, None]:
         ...
-        
\ No newline at end of file
+    async def get_batch_responses(self, requests: list[tuple[str, str]], include_thinking: bool=False) -> list[AIResponse]:
+        return await asyncio.gather(*[self.get_response(system_prompt=system_prompt, question=question, include_thinking=include_thinking) for system_prompt, question in requests])
@@ -11,6 +11,7 @@ from pickle import NONE
 import re, mcp
 from fastmcp import Client
 from dataclasses import dataclass, make_dataclass, asdict, is_dataclass, field
+from .SessionPool import MCPSessionPool
 
 @dataclass
 class Parameter:
@@ -23,14 +24,23 @@ class CapBaseStub:
     placeholder: bool = True
 
 class Capability:
-    def __init__(self, mcp_server: Client, name: str, description: str):
+    read_only = False
+    # safe to send again when the session drops before the reply arrives
+    replayable = False
+    timeout = None
+    def __init__(self, mcp_server: Client, name: str, description: str, session_pool: MCPSessionPool | None = None):
         self.mcp_server = mcp_server
+        self.session_pool = session_pool
         self.name = name.strip()
         self.description = description.strip()
         self.set_arguments([])
         self.set_responses([])
         self.output_results = None
     def __str__(self) -> str:
+        if self._doc is None:
+            self._doc = self._render()
+        return self._doc
+    def _render(self) -> str:
         arguments = asdict(self.arguments) if self.arguments is not None else None
         del arguments['placeholder']
         if arguments == {}:
@@ -43,13 +53,20 @@ class Capability:
     @abstractclassmethod
     async def call(cls, **kwargs) -> object:
         ...
+    async def _invoke(self, operation: str, *args) -> object:
+        if self.session_pool is not None:
+            return await getattr(self.session_pool, operation)(self.mcp_server, *args, replayable=self.replayable)
+        async with self.mcp_server:
+            return await getattr(self.mcp_server, operation)(*args)
     def set_arguments(self, arglist: list) -> None:
+        self._doc = None
         if len(arglist) > 0:
             self.arguments = make_dataclass(f'Inputs', arglist, bases=(CapBaseStub), namespace=f'{self.mcp_server.name}_{self.name}')
         else:
             self.arguments = CapBaseStub()
         return
     def set_responses(self, arglist: list) -> None:
+        self._doc = None
         if len(arglist) > 0:
             self.responses = make_dataclass(f'Outputs', arglist, bases=(CapBaseStub), namespace=f'{self.mcp_server.name}_{self.name}')
         else:
@@ -57,23 +74,33 @@ class Capability:
         return
 
 class Tool(Capability):
-    def __init__(self, mcp_server: Client, schema: mcp.types.Tool):
-        super().__init__(mcp_server, schema.name, schema.description)
+    def __init__(self, mcp_server: Client, schema: mcp.types.Tool, session_pool: MCPSessionPool | None = None):
+        super().__init__(mcp_server, schema.name, schema.description, session_pool)
         print(f'TOOL: {schema}')
+        self.annotations = schema.annotations
+        self.read_only = schema.annotations is not None and schema.annotations.readOnlyHint is True
+        self.replayable = self.read_only or (schema.annotations is not None and schema.annotations.idempotentHint is True)
+        # servers may advertise how long a call is allowed to take as _meta {"timeout": seconds}
+        timeout = (schema.meta or {}).get('timeout')
+        self.timeout = float(timeout) if isinstance(timeout, (int, float)) and timeout > 0 else None
         self.inputs = None
         self.input_schema = None
         self.output_schema = None
+        self.required = []
         if schema.inputSchema is not None:
             self.input_schema = self._parse_schema(schema.inputSchema)
+            self.required = list(schema.inputSchema.get('required', []))
         self.outputs = None
         if schema.outputSchema is not None:
             self.output_schema = self._parse_schema(schema.outputSchema)
         return
     async def call(self, **kwargs) -> object:
-        async with self.mcp_server:
-            pass
-#            self.mcp_server.call_tool(self.name, **kwargs)
-        return
+        result = await self._invoke('call_tool', self.name, kwargs)
+        if result.data is not None:
+            return result.data
+        if result.structured_content is not None:
+            return result.structured_content
+        return '\n'.join([content.text for content in result.content if hasattr(content, 'text')])
     def _parse_schema(self, schema: dict) -> dict:
         defs = self._defs_from_schema(schema)
         return self._parameters_from_schema(schema, defs)
@@ -111,8 +138,10 @@ class Tool(Capability):
                     raise ValueError('Sub definitions are not supported at this time.')
         return self.schema_defs    
 class Resource(Capability):
-    def __init__(self, mcp_server: Client, schema: mcp.types.Resource | mcp.types.ResourceTemplate):
-        super().__init__(mcp_server, schema.name, schema.description)
+    read_only = True
+    replayable = True
+    def __init__(self, mcp_server: Client, schema: mcp.types.Resource | mcp.types.ResourceTemplate, session_pool: MCPSessionPool | None = None):
+        super().__init__(mcp_server, schema.name, schema.description, session_pool)
         print(f'RESOURCE: {schema}')
         self.parms = None
         self.uriTemplate = getattr(schema, 'uri', None)
@@ -126,19 +155,23 @@ class Resource(Capability):
                 self.parms[p.group(0)[1:-1]] = 'any'
         return
     async def call(self, **kwargs) -> object:
-        async with self.mcp_server:
-            pass
-#        if self.parms is None:
-#            self.mcp_server.read_resource(self.uriTemplate)
-        return
+        uri = str(self.uriTemplate)
+        if self.parms is not None:
+            for parm in self.parms:
+                uri = uri.replace(f'{{{parm}}}', str(kwargs.get(parm, '')))
+        contents = await self._invoke('read_resource', uri)
+        results = [content.text if hasattr(content, 'text') else content.blob for content in contents]
+        return results[0] if len(results) == 1 else results
 
 class Prompt(Capability):
-    def __init__(self, mcp_server: Client, schema: mcp.types.Prompt):
-        super().__init__(mcp_server, schema.name, schema.description)
+    read_only = True
+    replayable = True
+    def __init__(self, mcp_server: Client, schema: mcp.types.Prompt, session_pool: MCPSessionPool | None = None):
+        super().__init__(mcp_server, schema.name, schema.description, session_pool)
         print(f'PROMPT: {schema}')
         return
     async def call(self, **kwargs) -> object:
-        async with self.mcp_server:
-#            return self.mcp_server.get_prompt()
-            return 'Not implemented.'
+        result = await self._invoke('get_prompt', self.name, kwargs)
+        return '\n'.join([message.content.text for message in result.messages if hasattr(message.content, 'text')])
+
     
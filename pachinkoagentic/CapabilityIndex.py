@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+A small local BM25 index over the capabilities in the Library.  Used to send only the relevant part of the
+  library definition to the code generator rather than every function from every MCP server.
+"""
+
+import math
+import re
+from .Capabilities import Capability
+
+class CapabilityIndex:
+    k1 = 1.5
+    b = 0.75
+    def __init__(self, capabilities: dict):
+        self.entries = []
+        self.postings = {}
+        self.lengths = []
+        for server in capabilities:
+            for capability in capabilities[server]['capabilities']:
+                terms = CapabilityIndex.tokenize(' '.join([server, capability.name, capability.description] + CapabilityIndex.parameters(capability)))
+                document = len(self.entries)
+                self.entries.append((server, capability))
+                self.lengths.append(len(terms))
+                for term in terms:
+                    counts = self.postings.setdefault(term, {})
+                    counts[document] = counts.get(document, 0) + 1
+        self.average_length = sum(self.lengths) / len(self.lengths) if len(self.lengths) > 0 else 0.0
+        return
+    @staticmethod
+    def tokenize(text: str) -> list:
+        return [token.lower() for token in re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+', text)]
+    @staticmethod
+    def parameters(capability: Capability) -> list:
+        parameters = getattr(capability, 'input_schema', None) or getattr(capability, 'parms', None) or {}
+        return list(parameters)
+    def search(self, question: str, top_k: int) -> list:
+        scores = {}
+        for term in set(CapabilityIndex.tokenize(question)):
+            counts = self.postings.get(term)
+            if counts is None:
+                continue
+            idf = math.log(1 + (len(self.entries) - len(counts) + 0.5) / (len(counts) + 0.5))
+            for document, frequency in counts.items():
+                norm = CapabilityIndex.k1 * (1 - CapabilityIndex.b + CapabilityIndex.b * self.lengths[document] / self.average_length)
+                scores[document] = scores.get(document, 0.0) + idf * frequency * (CapabilityIndex.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores, key=lambda document: scores[document], reverse=True)[:top_k]
+        return [(self.entries[document][0], self.entries[document][1], scores[document]) for document in ranked]
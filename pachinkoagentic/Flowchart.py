@@ -3,11 +3,20 @@
 @author: Dr. William N. Roney
 
 This file the flowchart SVG code
+
+The chart is built from the AST of the generated function.  Every MCP call, Wait, loop and branch is a
+  symbol, edges are the real dependencies between them (a call uses a value another produced, a call
+  runs inside a loop or branch, Output keeps its order) and each symbol sits one row below the deepest
+  symbol it depends on.  Plans that are still streaming in are parsed up to the last complete statement.
+
+The markup is laid out when the chart is finished and kept until a symbol is added, with a placeholder for the
+  fill of every symbol, so renders (the first one, the heatmap, a cached plan) only substitute the colours.
 """
 
+import ast
 from abc import abstractclassmethod
 from .Logging import get_async_logger
-logger = get_async_logger(__name__, 'INFO')   
+logger = get_async_logger(__name__, 'INFO')
 
 
 from typing import Self, List
@@ -16,6 +25,8 @@ from .WorkflowEvent import WorkflowEvent, WorkflowEventType
 class Symbol():
     def __init__(self, lineno: int):
         self.lineno = lineno
+        self.preds = []
+        self.row = 0
         self.connection_point_lower = (None,None)
         self.connection_point_upper = (None,None)
     def set_connection_points(self, center_x, center_y, radius):
@@ -23,106 +34,290 @@ class Symbol():
         self.connection_point_lower = (center_x, center_y+radius)
         return
     @abstractclassmethod
-    def svg(self, center_x: int, center_y:int , radius: int) -> str:
+    def svg(self, center_x: int, center_y:int , radius: int, fill: str = 'lightgray') -> str:
         ...
 
 class Start(Symbol):
     def __init__(self):
         super().__init__(lineno = None)
-    def svg(self, center_x: int, center_y:int , radius: int) -> str:
+    def svg(self, center_x: int, center_y:int , radius: int, fill: str = 'lightgray') -> str:
         self.set_connection_points(center_x, center_y, radius)
         return f'<circle cx="{center_x}" cy="{center_y}" r="{radius}" fill="black" id="line0" />'
 
 class End(Symbol):
     def __init__(self):
         super().__init__(lineno = 1)
-    def svg(self, center_x: int, center_y:int , radius: int) -> str:
+    def svg(self, center_x: int, center_y:int , radius: int, fill: str = 'lightgray') -> str:
         self.set_connection_points(center_x, center_y, radius)
-        return f'<circle cx="{center_x}" cy="{center_y}" r="{radius}" fill="lightgray" id="line{self.lineno}" stroke="black" stroke-width="2"/><circle cx="{center_x}" cy="{center_y}" r="{radius/2}" fill="black" id="lineno"/>'
+        return f'<circle cx="{center_x}" cy="{center_y}" r="{radius}" fill="{fill}" id="line{self.lineno}" stroke="black" stroke-width="2"/><circle cx="{center_x}" cy="{center_y}" r="{radius/2}" fill="black" id="lineno"/>'
 
 class Call(Symbol):
     def __init__(self, lineno):
         super().__init__(lineno)
-    def svg(self, center_x: int, center_y:int , radius: int) -> str:
+    def svg(self, center_x: int, center_y:int , radius: int, fill: str = 'lightgray') -> str:
         self.set_connection_points(center_x, center_y, radius)
-        return f'<rect x="{center_x-radius}" y="{center_y-radius}" width="{2*radius}" height="{2*radius}" fill="lightgray" id="line{self.lineno}" stroke="black" stroke-width="2"/><text x="{center_x}" y="{center_y}" dominant-baseline="middle" text-anchor="middle" id="lineno">{self.lineno}</text>'
+        return f'<rect x="{center_x-radius}" y="{center_y-radius}" width="{2*radius}" height="{2*radius}" fill="{fill}" id="line{self.lineno}" stroke="black" stroke-width="2"/><text x="{center_x}" y="{center_y}" dominant-baseline="middle" text-anchor="middle" id="lineno">{self.lineno}</text>'
 
 class Junction(Symbol):
     def __init__(self, lineno):
         super().__init__(lineno)
-    def svg(self, center_x: int, center_y:int , radius: int) -> str:
+    def svg(self, center_x: int, center_y:int , radius: int, fill: str = 'lightgray') -> str:
         self.set_connection_points(center_x, center_y, radius)
-        return f'<polygon points="{center_x},{center_y-radius} {center_x+radius},{center_y} {center_x},{center_y+radius} {center_x-radius},{center_y}" fill="lightgray" id="line{self.lineno}" stroke="black" stroke-width="2"/><text x="{center_x}" y="{center_y}" dominant-baseline="middle" text-anchor="middle" id="lineno">{self.lineno}</text>'
+        return f'<polygon points="{center_x},{center_y-radius} {center_x+radius},{center_y} {center_x},{center_y+radius} {center_x-radius},{center_y}" fill="{fill}" id="line{self.lineno}" stroke="black" stroke-width="2"/><text x="{center_x}" y="{center_y}" dominant-baseline="middle" text-anchor="middle" id="lineno">{self.lineno}</text>'
+
+class Loop(Symbol):
+    def __init__(self, lineno):
+        super().__init__(lineno)
+    def svg(self, center_x: int, center_y:int , radius: int, fill: str = 'lightgray') -> str:
+        self.set_connection_points(center_x, center_y, radius)
+        half = radius/2
+        return f'<polygon points="{center_x-half},{center_y-radius} {center_x+half},{center_y-radius} {center_x+radius},{center_y} {center_x+half},{center_y+radius} {center_x-half},{center_y+radius} {center_x-radius},{center_y}" fill="{fill}" id="line{self.lineno}" stroke="black" stroke-width="2"/><text x="{center_x}" y="{center_y}" dominant-baseline="middle" text-anchor="middle" id="lineno">{self.lineno}</text>'
+
+class Branch(Symbol):
+    def __init__(self, lineno):
+        super().__init__(lineno)
+    def svg(self, center_x: int, center_y:int , radius: int, fill: str = 'lightgray') -> str:
+        self.set_connection_points(center_x, center_y, radius)
+        return f'<polygon points="{center_x-radius},{center_y-radius} {center_x+radius},{center_y-radius} {center_x},{center_y+radius}" fill="{fill}" id="line{self.lineno}" stroke="black" stroke-width="2"/><text x="{center_x}" y="{center_y-radius/3}" dominant-baseline="middle" text-anchor="middle" id="lineno">{self.lineno}</text>'
 
 class Flowchart():
     min_width = 100
     min_height = 100
     symbol_radius = 15
     padding = 10
-    def __init__(self):
-        self.rows = [[Start()],[]]
-    def add_row(self) -> None:
-        self.rows.append([])
-        return 
-    def add_to_current_row(self, symbol: Symbol) -> None:
-        self.rows[-1].append(symbol)
+    default_fill = 'lightgray'
+    fill_placeholder = '\x00'
+    hex_bytes = [f'{i:02x}' for i in range(256)]
+    placeholder_declaration = 'async def PACHINKO_AGENTIC_WORKFLOW(MCP):'
+    def __init__(self, package: str = 'MCP'):
+        self.package = package
+        self.source = {}
+        self.reset()
+    def reset(self) -> None:
+        self.start = Start()
+        self.end = None
+        self.rows = [[self.start]]
+        self.defs = {}
+        self.outputs = None
+        self.committed = 1
+        self._layout = None
         return
     async def from_code(self, workflow_id: str, code: str) -> Self:
         lines = code.split('\n')
         await logger.debug(code)
-        await logger.debug(f'Building image from {len(lines)} lines of code')
-        currentline = 1 # skipping first line which is function declaration
-        while currentline < len(lines):
-            line = lines[currentline].strip()
-            currentline += 1 # for direct printing, inc here
-            if len(line) > 0: #ignore blank lines, it also lstripped indention
-                if 'MCP.' in line: #we have something
-                    if 'Wait' in line:
-                        self.add_row()
-                        self.add_to_current_row(Junction(currentline))
-                        self.add_row()
-                        await logger.debug(f'Line{currentline} is a diamond.')
-                    else:
-                        if 'await' in line: # square
-                            self.add_to_current_row(Call(currentline))
-                            self.add_row()
-                            await logger.debug(f'Line{currentline} by itself on a row.')
-                        else: 
-                            self.add_to_current_row(Call(currentline))
-                            await logger.debug(f'Line{currentline} shares a row.')
-        self.add_row()                    
-        self.add_to_current_row(End())
-        self.rows = [row for row in self.rows if len(row) > 0] #remove empties.
+        await logger.debug('Building image from %d lines of code', len(lines))
+        self.source = dict(enumerate(lines, 1))
+        self.reset()
+        return self.finish()
+    async def add_line(self, currentline: int, line: str) -> None:
+        self.source[currentline] = line
+        if len(line.strip()) > 0:
+            self.consume(final=False)
+        return
+    def finish(self) -> Self:
+        self.consume(final=True)
+        self.end = End()
+        leaves = self.leaves()
+        self.end.preds = leaves if len(leaves) > 0 else [self.start]
+        self.end.row = max(pred.row for pred in self.end.preds) + 1
+        self.rows.append([self.end])
+        self._cache_layout()
         return self
-    async def svg(self) -> str:
-        async def connect_rows(rows: List[List[Symbol]]) -> str:
-            connectors = ''
-            current_row = 1
-            while current_row < len(rows):
-                for upper_symbol in rows[current_row - 1]:
-                    for lower_symbol in rows[current_row]:
-                        await logger.debug(f'Connecting {upper_symbol} to {lower_symbol}')
-                        connectors += f'<line x1="{upper_symbol.connection_point_lower[0]}" y1="{upper_symbol.connection_point_lower[1]}" x2="{lower_symbol.connection_point_upper[0]}" y2="{lower_symbol.connection_point_upper[1]}" stroke-width="1" stroke="blue" />'
-                current_row += 1
-            return connectors
+    def snapshot(self) -> Self:
+        if self.end is not None:
+            return self
+        flowchart = Flowchart(self.package)
+        flowchart.source = dict(self.source)
+        flowchart.start = self.start
+        flowchart.rows = [list(row) for row in self.rows]
+        flowchart.defs = dict(self.defs)
+        flowchart.outputs = self.outputs
+        flowchart.committed = self.committed
+        return flowchart.finish()
+    def leaves(self) -> list:
+        used = {id(pred) for row in self.rows for symbol in row for pred in symbol.preds}
+        return [symbol for row in self.rows[1:] for symbol in row if id(symbol) not in used]
+    def consume(self, final: bool) -> None:
+        # only the statements after the last committed one are parsed again.  While streaming, the last
+        #  statement may still grow (a loop body, an else) so it is only committed once another follows it.
+        body = self.parse()
+        if body is None:
+            return
+        if not final:
+            body = body[:-1]
+        if len(body) > 0:
+            self._visit_block(body, [])
+            self.committed = body[-1].end_lineno
+        return
+    def parse(self) -> list | None:
+        if len(self.source) == 0:
+            return None
+        lines = [self.source.get(lineno, '') for lineno in range(self.committed+1, max(self.source)+1)]
+        prefix = '\n' * (self.committed - 1) + Flowchart.placeholder_declaration + '\n'
+        while len(lines) > 0:
+            try:
+                tree = ast.parse(prefix + '\n'.join(lines))
+                return tree.body[0].body
+            except SyntaxError:
+                lines.pop() # a plan that is still streaming may end part way through a statement
+        return None
+    def _add(self, symbol: Symbol, preds: list) -> Symbol:
+        unique = {}
+        for pred in preds:
+            unique[id(pred)] = pred
+        symbol.preds = list(unique.values()) if len(unique) > 0 else [self.start]
+        symbol.row = max(pred.row for pred in symbol.preds) + 1
+        while len(self.rows) <= symbol.row:
+            self.rows.append([])
+        self.rows[symbol.row].append(symbol)
+        self._layout = None
+        return symbol
+    def _mcp_function(self, call: ast.Call) -> str | None:
+        func = call.func
+        while isinstance(func, ast.Attribute):
+            if isinstance(func.value, ast.Name) and func.value.id == self.package:
+                return func.attr
+            func = func.value
+        return None
+    def _contains_mcp(self, node: ast.AST) -> bool:
+        return any(isinstance(child, ast.Call) and self._mcp_function(child) is not None for child in ast.walk(node))
+    def _visit_expr(self, expr: ast.AST, control: list) -> list:
+        # returns the symbols whose results flow into the value of expr
+        if isinstance(expr, ast.Call):
+            function = self._mcp_function(expr)
+            if function is not None:
+                preds = list(control)
+                for arg in expr.args + [keyword.value for keyword in expr.keywords]:
+                    preds += self._visit_expr(arg, control)
+                if function == 'Wait':
+                    symbol = Junction(expr.lineno)
+                else:
+                    symbol = Call(expr.lineno)
+                    if function == 'Output':
+                        if self.outputs is not None:
+                            preds.append(self.outputs)
+                        self.outputs = symbol
+                return [self._add(symbol, preds)]
+        if isinstance(expr, ast.Name):
+            return list(self.defs.get(expr.id, [])) if isinstance(expr.ctx, ast.Load) else []
+        if isinstance(expr, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            return []
+        values = []
+        for child in ast.iter_child_nodes(expr):
+            values += self._visit_expr(child, control)
+        return values
+    def _assign(self, targets: list, values: list, augment: bool = False) -> None:
+        for target in targets:
+            for node in ast.walk(target):
+                if isinstance(node, ast.Name):
+                    self.defs[node.id] = values + (self.defs.get(node.id, []) if augment else [])
+        return
+    def _merge(self, first: dict, second: dict) -> None:
+        # only names rebound by the block differ between the two, everything else is the same list object
+        merged = dict(second)
+        for name, symbols in first.items():
+            other = second.get(name)
+            if other is not symbols:
+                merged[name] = symbols + [symbol for symbol in other or [] if symbol not in symbols]
+        self.defs = merged
+        return
+    def _visit_block(self, body: list, control: list) -> None:
+        for statement in body:
+            if isinstance(statement, (ast.For, ast.AsyncFor, ast.While)):
+                values = self._visit_expr(statement.test if isinstance(statement, ast.While) else statement.iter, control)
+                inner = control
+                if self._contains_mcp(statement):
+                    inner = [self._add(Loop(statement.lineno), values + control)]
+                    values = inner
+                if not isinstance(statement, ast.While):
+                    self._assign([statement.target], values)
+                before = dict(self.defs)
+                self._visit_block(statement.body, inner)
+                self._visit_block(statement.orelse, inner)
+                self._merge(before, self.defs) # the loop may not run at all
+            elif isinstance(statement, ast.If):
+                values = self._visit_expr(statement.test, control)
+                inner = control
+                if any(self._contains_mcp(child) for child in statement.body + statement.orelse):
+                    inner = [self._add(Branch(statement.lineno), values + control)]
+                before = dict(self.defs)
+                self._visit_block(statement.body, inner)
+                taken = self.defs
+                self.defs = dict(before)
+                self._visit_block(statement.orelse, inner)
+                self._merge(taken, self.defs)
+            elif isinstance(statement, (ast.With, ast.AsyncWith)):
+                for item in statement.items:
+                    values = self._visit_expr(item.context_expr, control)
+                    if item.optional_vars is not None:
+                        self._assign([item.optional_vars], values)
+                self._visit_block(statement.body, control)
+            elif isinstance(statement, ast.Try) or type(statement).__name__ == 'TryStar':
+                self._visit_block(statement.body, control)
+                for handler in statement.handlers:
+                    self._visit_block(handler.body, control)
+                self._visit_block(statement.orelse, control)
+                self._visit_block(statement.finalbody, control)
+            elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            elif isinstance(statement, ast.Assign):
+                self._assign(statement.targets, self._visit_expr(statement.value, control))
+            elif isinstance(statement, (ast.AnnAssign, ast.AugAssign)):
+                values = self._visit_expr(statement.value, control) if statement.value is not None else []
+                self._assign([statement.target], values, augment=isinstance(statement, ast.AugAssign))
+            else:
+                self._visit_expr(statement, control)
+        return
+    @staticmethod
+    def heat(value: float, hottest: float) -> str:
+        # lightgray for the fastest line through to red for the slowest
+        ratio = value / hottest if hottest > 0 else 0.0
+        green_blue = Flowchart.hex_bytes[int(211 - 191*ratio)]
+        return f'#{Flowchart.hex_bytes[int(211 + 9*ratio)]}{green_blue}{green_blue}'
+    def layout(self) -> tuple[str, list]:
+        """The whole image with Flowchart.fill_placeholder for every fill, and the line numbers of those fills in order."""
         rowcount = len(self.rows)
         columncount = max(len(row) for row in self.rows)
-        await logger.debug(f'Flowchart has {rowcount} rows and the max row is {columncount} symbols wide.')
         height = max(Flowchart.min_height, rowcount * (2*Flowchart.symbol_radius + Flowchart.padding)+2*Flowchart.padding)
         width = max(Flowchart.min_width, (columncount+1) * (2*Flowchart.symbol_radius + Flowchart.padding) + 2*Flowchart.padding)
-        svg  = f'<svg version="1.1" width="{width}" height="{height}" xmlns="http://www.w3.org/20000/svg" id="flowchart">'
-        await logger.debug(f'Flowchart has {len(self.rows)} rows')
+        svg = [f'<svg version="1.1" width="{width}" height="{height}" xmlns="http://www.w3.org/20000/svg" id="flowchart">']
+        filled = []
+        edges = []
         row_center = 0
         for row in self.rows:
             row_center += (2*Flowchart.symbol_radius)
-            row_symbols = len(row)
-            colwidth = width / (row_symbols+1)
-            column_center = 0
-            await logger.debug(f'{row}')
-            for symbol in row:
-                column_center += colwidth
-                svg += symbol.svg(column_center, row_center, Flowchart.symbol_radius)
+            colwidth = width / (len(row)+1)
+            for column, symbol in enumerate(row, 1):
+                svg.append(symbol.svg(int(column * colwidth), row_center, Flowchart.symbol_radius, Flowchart.fill_placeholder))
+                if not isinstance(symbol, Start):
+                    filled.append(symbol.lineno)
+                # every predecessor sits in an earlier row, so its connection point is already placed
+                x2, y2 = symbol.connection_point_upper
+                for pred in symbol.preds:
+                    x1, y1 = pred.connection_point_lower
+                    edges.append(f'M{x1} {y1}L{x2} {y2}')
             row_center += Flowchart.padding
-        svg += await connect_rows(self.rows)
-        svg += '</svg>'
-        return svg
+        svg.append('<path stroke-width="1" stroke="blue" fill="none" d="')
+        svg += edges
+        svg.append('"/></svg>')
+        return ''.join(svg), filled
+    def _cache_layout(self) -> None:
+        markup, filled = self.layout()
+        self._layout = (markup, filled, markup.replace(Flowchart.fill_placeholder, Flowchart.default_fill))
+        return
+    async def svg(self, heatmap: dict | None = None) -> str:
+        if self._layout is None:
+            # a chart that is still being built, a finished one was laid out by finish()
+            await logger.debug('Flowchart has %d rows and the max row is %d symbols wide.', len(self.rows), max(len(row) for row in self.rows))
+            self._cache_layout()
+        markup, filled, plain = self._layout
+        if heatmap is None:
+            return plain
+        hottest = max(heatmap.values(), default=0.0)
+        colors = {lineno: Flowchart.heat(value, hottest) for lineno, value in heatmap.items()}
+        segments = markup.split(Flowchart.fill_placeholder)
+        svg = [segments[0]]
+        for lineno, segment in zip(filled, segments[1:]):
+            svg.append(colors.get(lineno, Flowchart.default_fill))
+            svg.append(segment)
+        return ''.join(svg)
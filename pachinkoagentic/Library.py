@@ -3,72 +3,267 @@
 @author: Dr. William N. Roney
 
 Converts a set of MCP Servers into a library.
+
+Each server's catalog is loaded under its own connect and list deadlines.  refresh() waits at most
+  refresh_timeout for the stale servers and returns with the catalog of those that answered; the rest keep
+  loading in the background and bump catalog_version when they merge in.  Servers that keep failing are
+  taken out of the catalog and skipped by their ServerHealth circuit breaker until it allows a probe.
+
+A server's catalog is marked stale when it sends a tools, resources or prompts list_changed notification, which
+  fastmcp can only pass to a message_handler given to the Client when it is built, so build it with
+  Library.client().  Other clients are refreshed once catalog_ttl has passed.
+
+tool_timeouts bounds each tool call in seconds: 'server.tool', then a timeout the tool advertises in its
+  _meta, then 'server.*', then '*'.
 """
 
 from .Logging import get_async_logger
 logger = get_async_logger(__name__, 'INFO')   
 
 import asyncio
+import hashlib
+import time
+import types
 import sys
 import importlib.util
 from fastmcp import Client
 from typing import Self
 from .Capabilities import Tool, Resource, Prompt
-from .MCPWrapper import MCPWrapper
+from .MCPWrapper import MCPWrapper, MCPServerWrapper
 from .AIWrapper import AIWrapper
+from .SessionPool import MCPSessionPool
+from .CapabilityIndex import CapabilityIndex
+from .ResultCache import ResultCache
+from .ServerHealth import ServerHealth
+from .Validator import Validator, ValidationResult
 
 class Library:
-    def __init__(self, packagename: str='MCP'):
+    list_changed_notifications = ['ToolListChangedNotification', 'ResourceListChangedNotification', 'PromptListChangedNotification']
+    def __init__(self, packagename: str='MCP', max_inflight_per_server: int=16, idle_timeout: float|None=None, catalog_ttl: float|None=300.0, result_cache: ResultCache|None=None,
+                 connect_timeout: float|None=10.0, list_timeout: float|None=30.0, refresh_timeout: float|None=5.0, failure_threshold: int=3, reset_timeout: float=30.0,
+                 tool_timeouts: dict|None=None, validator: Validator|None=None):
         self.mcp_servers = []
         self.capabilities = {}
         self.package = packagename
+        self.session_pool = MCPSessionPool(max_inflight=max_inflight_per_server, idle_timeout=idle_timeout, connect_timeout=connect_timeout)
+        self.catalog_ttl = catalog_ttl
+        self.result_cache = result_cache
+        self.list_timeout = list_timeout
+        self.refresh_timeout = refresh_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.validator = validator if validator is not None else Validator(packagename)
+        self.catalog_version = 0
+        self._catalog = {}
+        self._loading = {}
+        self._watched = set()
+        self._docs = (None, '')
+        self._index = (None, None)
+        self._hash = (None, '')
+        self._dispatch = (None, None)
+        self._functions = (None, None)
         pass
     def add(self, mcp_server: Client) -> Self:
         self.mcp_servers.append(mcp_server)
+        self.__entry(mcp_server)['watched'] = id(mcp_server) in self._watched
         return self
+    def client(self, transport, message_handler=None, **client_kwargs) -> Client:
+        """A fastmcp Client whose list_changed notifications mark its catalog stale, add() it as usual.  A
+        message_handler of your own still gets every message."""
+        mcp_server = None
+        async def list_changed(message) -> None:
+            if type(getattr(message, 'root', message)).__name__ in Library.list_changed_notifications:
+                self.invalidate(mcp_server)
+            if message_handler is not None:
+                await message_handler(message)
+            return
+        mcp_server = Client(transport, message_handler=list_changed, **client_kwargs)
+        self._watched.add(id(mcp_server))
+        return mcp_server
+    def __entry(self, mcp_server: Client) -> dict:
+        entry = self._catalog.get(id(mcp_server))
+        if entry is None:
+            entry = {'fingerprint': None, 'loaded': 0.0, 'stale': True, 'name': None, 'missing': [], 'watched': False,
+                     'health': ServerHealth(self.failure_threshold, self.reset_timeout)}
+            self._catalog[id(mcp_server)] = entry
+        return entry
+    def invalidate(self, mcp_server: Client) -> None:
+        self.__entry(mcp_server)['stale'] = True
+        return
+    def is_stale(self, mcp_server: Client) -> bool:
+        entry = self._catalog.get(id(mcp_server))
+        if entry is None or entry['stale']:
+            return True
+        return self.catalog_ttl is not None and time.monotonic() - entry['loaded'] > self.catalog_ttl
     async def reload(self) -> Self:
-        self.capabilities = {}
-        coroutines = []
         for mcp_server in self.mcp_servers:
-            await logger.debug(f'mcp_server: {type(mcp_server)}: {mcp_server}')
-            coroutines.append(asyncio.ensure_future(self.__load_capabilities(mcp_server)))
-        await asyncio.gather(*coroutines)
+            self.invalidate(mcp_server)
+        return await self.refresh()
+    async def refresh(self) -> Self:
+        loads = []
+        for mcp_server in self.mcp_servers:
+            if self.is_stale(mcp_server):
+                if not self.__entry(mcp_server)['health'].allow():
+                    await logger.debug('Skipping MCP Server(%s), its circuit breaker is open.', mcp_server.transport)
+                    continue
+                await logger.debug('mcp_server: %s: %s', type(mcp_server), mcp_server)
+                loads.append(self.__load(mcp_server))
+        if len(loads) > 0:
+            _, pending = await asyncio.wait(loads, timeout=self.refresh_timeout)
+            while len(pending) > 0 and len(self.capabilities) == 0:
+                # nothing to generate against yet, so take the first server that answers
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if len(pending) > 0:
+                # still loading, they merge into the catalog when they finish
+                await logger.info(f'{len(pending)} MCP servers did not load within {self.refresh_timeout} seconds, continuing with a partial catalog.')
         return self
+    def __load(self, mcp_server: Client) -> asyncio.Future:
+        key = id(mcp_server)
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = asyncio.ensure_future(self.__load_capabilities(mcp_server))
+            self._loading[key] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(key, None))
+        return loading
     async def __load_capabilities(self, mcp_server: Client):
+        entry = self.__entry(mcp_server)
+        entry['stale'] = False
         try:
-            async with mcp_server:
-                self.capabilities[mcp_server.initialize_result.serverInfo.name] = {'client': mcp_server, 'instructions': mcp_server.initialize_result.instructions.strip(), 'capabilities': []}
-                tools = await mcp_server.list_tools()
-                for tool in tools:
-                    self.capabilities[mcp_server.initialize_result.serverInfo.name]['capabilities'].append(Tool(mcp_server, tool))
-                resources = await mcp_server.list_resources()
-                for resource in resources:
-                    await logger.debug(f'Parsing: {resource}')
-                    self.capabilities[mcp_server.initialize_result.serverInfo.name]['capabilities'].append(Resource(mcp_server, resource))
-                resource_templates = await mcp_server.list_resource_templates()
-                for resource in resource_templates:
-                    await logger.debug(f'Parsing: {resource}')
-                    self.capabilities[mcp_server.initialize_result.serverInfo.name]['capabilities'].append(Resource(mcp_server, resource))
-                prompts = await mcp_server.list_prompts()
-                for prompt in prompts:
-                    await logger.debug(f'Parsing: {prompt}')
-                    self.capabilities[mcp_server.initialize_result.serverInfo.name]['capabilities'].append(Prompt(mcp_server, prompt))
+            async with self.session_pool.session(mcp_server):
+                name = mcp_server.initialize_result.serverInfo.name
+                instructions = mcp_server.initialize_result.instructions.strip()
+                try:
+                    async with asyncio.timeout(self.list_timeout):
+                        schemas = [(Tool, tool) for tool in await mcp_server.list_tools()]
+                        schemas += [(Resource, resource) for resource in await mcp_server.list_resources()]
+                        schemas += [(Resource, resource) for resource in await mcp_server.list_resource_templates()]
+                        schemas += [(Prompt, prompt) for prompt in await mcp_server.list_prompts()]
+                except TimeoutError:
+                    raise TimeoutError(f'{name} did not list its capabilities within {self.list_timeout} seconds') from None
+            if not entry['watched'] and entry['loaded'] == 0.0:
+                await logger.info(f'{name} list_changed notifications are not watched as its Client was not built by Library.client(), '
+                                  f'its catalog is refreshed every {self.catalog_ttl} seconds.')
+            entry['loaded'] = time.monotonic()
+            entry['name'] = name
+            # a capability named like one of the wrapper's own attributes could not be dispatched
+            entry['missing'] = [schema.name for cls, schema in schemas if MCPServerWrapper.reserved(schema.name)]
+            if len(entry['missing']) > 0:
+                await logger.warning(f'{name} capabilities {entry["missing"]} use reserved names and are left out of the catalog.')
+                schemas = [(cls, schema) for cls, schema in schemas if not MCPServerWrapper.reserved(schema.name)]
+            entry['health'].success()
+            fingerprints = [hashlib.sha256(f'{cls.__name__}:{schema.model_dump_json()}'.encode()).hexdigest() for cls, schema in schemas]
+            fingerprint = hashlib.sha256('\n'.join([name, instructions] + fingerprints).encode()).hexdigest()
+            if fingerprint == entry['fingerprint'] and name in self.capabilities:
+                await logger.debug('%s catalog unchanged.', name)
+                return
+            previous = self.capabilities.get(name, {}).get('fingerprints', {})
+            capabilities = {}
+            for (cls, schema), capability_fingerprint in zip(schemas, fingerprints):
+                capability = previous.get(capability_fingerprint)
+                if capability is None:
+                    await logger.debug('Parsing: %s', schema)
+                    capability = cls(mcp_server, schema, self.session_pool)
+                capabilities[capability_fingerprint] = capability
+            self.capabilities[name] = {'client': mcp_server, 'instructions': instructions, 'capabilities': list(capabilities.values()), 'fingerprints': capabilities}
+            entry['fingerprint'] = fingerprint
+            if self.result_cache is not None:
+                self.result_cache.invalidate(name)
+            self.catalog_version += 1
+            await logger.debug('%s catalog changed, now at version %d.', name, self.catalog_version)
         except Exception as e:
+            entry['stale'] = True
             await logger.error(f'Error loading capabilities from MCP Server({mcp_server.transport}) => {type(e)}:{e}')
+            if entry['health'].failure(f'{type(e)}:{e}') and entry['name'] in self.capabilities:
+                # out of service until a probe succeeds, so plans are not generated against it
+                entry['missing'] = [capability.name for capability in self.capabilities.pop(entry['name'])['capabilities']]
+                entry['fingerprint'] = None
+                if self.result_cache is not None:
+                    self.result_cache.invalidate(entry['name'])
+                self.catalog_version += 1
+                await logger.warning(f'{entry["name"]} removed from the catalog after {entry["health"].failures} failures, missing {len(entry["missing"])} capabilities.')
         return
-    def swagger_docs(self) -> str:
-        swaggerDocs = ''
-        swaggerDocs += f'{MCPWrapper.builtins(self.package)}\n'
+    def health(self) -> dict:
+        servers = {}
+        for mcp_server in self.mcp_servers:
+            entry = self.__entry(mcp_server)
+            name = entry['name'] or str(mcp_server.transport)
+            servers[name] = dict(entry['health'].snapshot(), loading=id(mcp_server) in self._loading, in_catalog=entry['name'] in self.capabilities,
+                                 capabilities=len(self.capabilities[name]['capabilities']) if name in self.capabilities else 0, missing=entry['missing'], watched=entry['watched'])
+        return servers
+    def unavailable(self) -> list:
+        return [name for name, server in self.health().items() if not server['in_catalog']]
+    def set_server_limit(self, servername: str, max_inflight: int) -> None:
+        self.session_pool.set_limit(self.capabilities[servername]['client'], max_inflight)
+        return
+    def is_read_only(self, servername: str, capname: str) -> bool:
+        if servername not in self.capabilities:
+            return False
+        return any(cap.name == capname and cap.read_only for cap in self.capabilities[servername]['capabilities'])
+    async def close(self) -> None:
+        for loading in list(self._loading.values()):
+            loading.cancel()
+        await self.session_pool.close()
+        return
+    def catalog_hash(self) -> str:
+        if self._hash[0] != self.catalog_version:
+            fingerprints = sorted(entry['fingerprint'] or '' for entry in self._catalog.values())
+            self._hash = (self.catalog_version, hashlib.sha256('\n'.join([self.package] + fingerprints).encode()).hexdigest())
+        return self._hash[1]
+    def capability_index(self) -> CapabilityIndex:
+        if self._index[0] != self.catalog_version:
+            self._index = (self.catalog_version, CapabilityIndex(self.capabilities))
+        return self._index[1]
+    def relevant_docs(self, question: str, top_k: int) -> tuple[str, int]:
+        matches = self.capability_index().search(question, top_k)
+        if len(matches) == 0:
+            return self.swagger_docs(), sum(len(self.capabilities[lib]['capabilities']) for lib in self.capabilities)
+        selected = {}
+        for lib, capability, _ in matches:
+            selected.setdefault(lib, set()).add(id(capability))
+        swaggerDocs = [f'{MCPWrapper.builtins(self.package)}\n']
         for lib in self.capabilities:
-            swaggerDocs += f'Module: {lib}\nInstructions: {self.capabilities[lib]["instructions"]}\n'
+            if lib in selected:
+                swaggerDocs.append(f'Module: {lib}\nInstructions: {self.capabilities[lib]["instructions"]}\n')
+                for capability in self.capabilities[lib]['capabilities']:
+                    if id(capability) in selected[lib]:
+                        swaggerDocs.append(f'{capability}\n')
+                swaggerDocs.append('\n')
+        return ''.join(swaggerDocs), len(matches)
+    def swagger_docs(self) -> str:
+        if self._docs[0] != self.catalog_version:
+            swaggerDocs = [f'{MCPWrapper.builtins(self.package)}\n']
+            for lib in self.capabilities:
+                swaggerDocs.append(self.__server_docs(lib))
+            self._docs = (self.catalog_version, ''.join(swaggerDocs))
+        return self._docs[1]
+    def __server_docs(self, lib: str) -> str:
+        if self.capabilities[lib].get('docs') is None:
+            docs = [f'Module: {lib}\nInstructions: {self.capabilities[lib]["instructions"]}\n']
             for capability in self.capabilities[lib]['capabilities']:
-                swaggerDocs += f'{capability}\n'
-            swaggerDocs += '\n'
-        return swaggerDocs
+                docs.append(f'{capability}\n')
+            docs.append('\n')
+            self.capabilities[lib]['docs'] = ''.join(docs)
+        return self.capabilities[lib]['docs']
     
-    def mcp_wrapper(self, llm: AIWrapper, workflow_id: str) -> MCPWrapper:
-        mcpcode = MCPWrapper(llm, workflow_id)
-        for lib in self.capabilities:
-            mcpcode.add_server_functions(lib, self.capabilities[lib]['client'], self.capabilities[lib]['capabilities'])
-        return mcpcode
+    def dispatch_table(self) -> types.MappingProxyType:
+        if self._dispatch[0] != self.catalog_version:
+            servers = {}
+            for lib in self.capabilities:
+                if self.capabilities[lib].get('dispatch') is None:
+                    self.capabilities[lib]['dispatch'] = MCPServerWrapper.compile(lib, self.capabilities[lib]['client'], self.capabilities[lib]['capabilities'], self.result_cache, self.tool_timeouts)
+                servers[lib] = self.capabilities[lib]['dispatch']
+            self._dispatch = (self.catalog_version, types.MappingProxyType(servers))
+        return self._dispatch[1]
+    def functions(self) -> dict:
+        if self._functions[0] != self.catalog_version:
+            self._functions = (self.catalog_version, {lib: {capability.name: capability for capability in self.capabilities[lib]['capabilities']} for lib in self.capabilities})
+        return self._functions[1]
+    def validate(self, code: str, funcname: str) -> ValidationResult:
+        return self.validator.validate(code, funcname, self.functions(), self.catalog_version)
+    def docs_for(self, modules: set) -> str:
+        # the built ins plus only the named modules, for prompts that do not need the whole library
+        return ''.join([f'{MCPWrapper.builtins(self.package)}\n'] + [self.__server_docs(lib) for lib in self.capabilities if lib in modules])
+    def mcp_wrapper(self, llm: AIWrapper, workflow_id: str, **options) -> MCPWrapper:
+        return MCPWrapper(llm, workflow_id, self.dispatch_table(), validator=self.validate, **options)
     
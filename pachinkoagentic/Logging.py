@@ -7,10 +7,17 @@ Because MCP has logging ability from server to client, this is a wrapper that li
   as across the MCP protocol to the client which will also log.
 """
 
+import atexit
 import logging
-from typing import Literal, Any
+import logging.handlers
+import queue
+from typing import Literal, Any, Callable
 from rich.console import Console
 from rich.logging import RichHandler
+try:
+    from fastmcp.server.dependencies import get_context
+except ImportError:
+    get_context = None
 
 #FORMAT = "[<%(name)s> %(asctime)s:%(filename)s:%(lineno)s:%(levelname)s] %(message)s"
 #logging.basicConfig(format=FORMAT, level=logging.INFO)
@@ -18,11 +25,12 @@ from rich.logging import RichHandler
 class MCPLogger():
     def __init__(self, logger):
         self.logger = logger
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
     def get_destination(self):
         logger_name = None
         ctx = None
         try:
-            from fastmcp.server.dependencies import get_context
             ctx = get_context()
             if ctx is not None:
                 mcp = ctx.fastmcp
@@ -31,42 +39,48 @@ class MCPLogger():
         except:
             pass
         return logger_name, ctx
-        
-    async def info(self, message: str) -> None:
-        self.logger.info(message, stacklevel=2)
+    async def _log(self, level: int, ctx_method: str, message: str | Callable[[], str], args: tuple) -> None:
+        # message may be a %-style format with args or a callable, neither is rendered unless the level is enabled
+        if not self.logger.isEnabledFor(level):
+            return
+        if callable(message):
+            message = message()
+        elif len(args) > 0:
+            message = message % args
+        self.logger.log(level, message, stacklevel=3)
         name, ctx = self.get_destination()
         if ctx is not None:
-            await ctx.info(message,name)
+            await getattr(ctx, ctx_method)(message,name)
         return
-    async def debug(self, message: str) -> None:
-        self.logger.debug(message, stacklevel=2)
-        name, ctx = self.get_destination()
-        if ctx is not None:
-            await ctx.debug(message,name)
+    async def info(self, message: str | Callable[[], str], *args) -> None:
+        await self._log(logging.INFO, 'info', message, args)
         return
-    async def error(self, message: str) -> None:
-        self.logger.error(message, stacklevel=2)
-        name, ctx = self.get_destination()
-        if ctx is not None:
-            await ctx.error(message,name)
+    async def debug(self, message: str | Callable[[], str], *args) -> None:
+        await self._log(logging.DEBUG, 'debug', message, args)
         return
-    async def warning(self, message: str) -> None:
-        self.logger.warning(message, stacklevel=2)
-        name, ctx = self.get_destination()
-        if ctx is not None:
-            await ctx.warning(message,name)
+    async def error(self, message: str | Callable[[], str], *args) -> None:
+        await self._log(logging.ERROR, 'error', message, args)
         return
-    async def warn(self, message: str) -> None:
-        self.logger.warning(message, stacklevel=2)
-        name, ctx = self.get_destination()
-        if ctx is not None:
-            await ctx.warning(message,name)
+    async def warning(self, message: str | Callable[[], str], *args) -> None:
+        await self._log(logging.WARNING, 'warning', message, args)
+        return
+    async def warn(self, message: str | Callable[[], str], *args) -> None:
+        await self._log(logging.WARNING, 'warning', message, args)
         return
 
+_queue_listeners = {}
+
+@atexit.register
+def _stop_queue_listeners() -> None:
+    for name in list(_queue_listeners):
+        _queue_listeners.pop(name).stop()
+    return
+
 def get_async_logger(name: str, 
-               level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] | int = "INFO") -> MCPLogger:
+               level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] | int = "INFO",
+               use_queue: bool = False) -> MCPLogger:
     logger = logging.getLogger(name)        
-    configure_logging(logger=logger, level=level)
+    configure_logging(logger=logger, level=level, use_queue=use_queue)
     return MCPLogger(logger)
 
 def configure_other_logging(loggers:list,
@@ -85,6 +99,7 @@ def configure_logging(
     level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] | int = "INFO",
     logger: logging.Logger | None = None,
     enable_rich_tracebacks: bool = True,
+    use_queue: bool = False,
     **rich_kwargs: Any,
 ) -> None:
     """
@@ -93,6 +108,7 @@ def configure_logging(
     Args:
         logger: the logger to configure
         level: the log level to use
+        use_queue: hand records to a background thread through a QueueHandler instead of rendering them inline
         rich_kwargs: the parameters to use for creating RichHandler
     """
 
@@ -114,6 +130,15 @@ def configure_logging(
     # Remove any existing handlers to avoid duplicates on reconfiguration
     for hdlr in logger.handlers[:]:
         logger.removeHandler(hdlr)
+    if logger.name in _queue_listeners:
+        _queue_listeners.pop(logger.name).stop()
+
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        _queue_listeners[logger.name] = listener
+        handler = logging.handlers.QueueHandler(log_queue)
 
     logger.addHandler(handler)
 
@@ -12,131 +12,222 @@ import asyncio
 import types
 import functools
 import inspect
-import importlib
+import collections
+import hashlib
+import weakref
 import sys
 import time
 from fastmcp import Client
 from .WorkflowEvent import WorkflowEventStream, WorkflowEventType, WorkflowEvent
 from .AIWrapper import AIWrapper
 from .Capabilities import Capability
-
-from random import randint
+from .Profiler import Profiler
+from .ResultCache import ResultCache
+from .Sampling import Sampler, SAMPLE_SYSTEM_PROMPT
+from .SessionPool import queue_time
 
 class MCPFunctionWrapper:
-    def __init__(self, mcp_server:Client, funcdef: Capability, sse: WorkflowEventStream):
+    def __init__(self, mcp_server:Client, funcdef: Capability, servername: str | None = None, result_cache: ResultCache | None = None, timeouts: dict | None = None):
         self.mcp_server = mcp_server
         self.funcdef = funcdef
-        self.sse = sse
-    async def execute(self, lineno, **kwargs):
+        self.servername = servername if servername is not None else mcp_server.name
+        self.result_cache = result_cache
+        self.cache_policy = result_cache.policy(self.servername, funcdef) if result_cache is not None else None
+        self.timeout = MCPFunctionWrapper.resolve_timeout(timeouts or {}, self.servername, funcdef)
+    @staticmethod
+    def resolve_timeout(timeouts: dict, servername: str, capability: Capability) -> float | None:
+        # configured for the tool, then advertised by the tool, then configured for the server, then for every tool
+        if f'{servername}.{capability.name}' in timeouts:
+            return timeouts[f'{servername}.{capability.name}']
+        if capability.timeout is not None:
+            return capability.timeout
+        return timeouts.get(f'{servername}.*', timeouts.get('*'))
+    async def execute(self, sse, lineno, **kwargs):
         start = time.time()
-        await self.sse.send_update(f'Beginning {self.mcp_server.name}.{self.funcdef.name}()', lineno=lineno, hover=self.funcdef.description)
-        async with self.mcp_server:
-            await logger.info(f'Calling {self.mcp_server.initialize_result.serverInfo.name}.{self.funcdef.name}({kwargs})')
-        await asyncio.sleep(randint(1,10))
-        await self.sse.send_update(f'Returned from {self.mcp_server.name}.{self.funcdef.name}()', hover=f'(func specific, TBD)\nTime: {time.time()-start:.2f} seconds.', lineno=lineno)
-        return
+        await sse.send_update(f'Beginning {self.mcp_server.name}.{self.funcdef.name}()', lineno=lineno, hover=self.funcdef.description, state='running')
+        await logger.info('Calling %s.%s(%s)', self.mcp_server.name, self.funcdef.name, kwargs)
+        queue_time.set(0.0)
+        cached = None
+        deadline = asyncio.timeout(self.timeout)
+        try:
+            async with deadline:
+                if self.cache_policy is not None:
+                    result, cached = await self.result_cache.call(self.cache_policy, self.servername, self.funcdef.name, kwargs, self.funcdef.call)
+                else:
+                    result = await self.funcdef.call(**kwargs)
+        except (Exception, asyncio.CancelledError) as e:
+            if sse.profiler is not None:
+                sse.profiler.record(lineno, f'{self.servername}.{self.funcdef.name}', time.time()-start, queued=queue_time.get(), failed=True)
+            if isinstance(e, asyncio.CancelledError):
+                await sse.send_update(f'Cancelled {self.mcp_server.name}.{self.funcdef.name}()', hover=f'Time: {time.time()-start:.2f} seconds.', lineno=lineno, state='cancelled')
+                raise
+            if deadline.expired():
+                await sse.send_update(f'Timed out {self.mcp_server.name}.{self.funcdef.name}()', hover=f'No result within {self.timeout} seconds.', lineno=lineno, state='timeout')
+                raise TimeoutError(f'{self.servername}.{self.funcdef.name}() did not return within {self.timeout} seconds') from None
+            await sse.send_update(f'Failed {self.mcp_server.name}.{self.funcdef.name}()', hover=f'{type(e)}:{e}\nTime: {time.time()-start:.2f} seconds.', lineno=lineno, state='failed')
+            raise
+        if sse.profiler is not None:
+            sse.profiler.record(lineno, f'{self.servername}.{self.funcdef.name}', time.time()-start, queued=queue_time.get())
+        hover = f'Cache {cached}.' if cached is not None else '(func specific, TBD)'
+        await sse.send_update(f'Returned from {self.mcp_server.name}.{self.funcdef.name}()', hover=f'{hover}\nTime: {time.time()-start:.2f} seconds.', lineno=lineno, state='done')
+        return result
         
+# compile() builds one subclass per server catalog that every workflow shares; instances only bind it to a workflow.
 class MCPServerWrapper:
-    def __init__(self, name:str, sse: WorkflowEventStream, mcp_server:Client):
-        self.name = name
+    __slots__ = ('sse',)
+    name = None
+    mcp_server = None
+    funcWrappers = types.MappingProxyType({})
+    def __init__(self, sse):
         self.sse = sse
-        self.mcp_server = mcp_server
-        self.funcWrappers = {}
-        pass
-    def add_tool(self, cap: Capability):
-        def create_foo(cap: Capability):
-            def function_stub(*args, **kwargs):
-                async def foo(*args, **kwargs):
-                    retval = None
-                    server_name = self.__class__.__name__
-                    t = asyncio.current_task()
-                    if t is not None:
-                        tn = t.get_name()
-                        if tn.startswith('Agentic'):
-                            methodline = tn.split('-')[1].split(':')
-                            method_name = methodline[0]
-                            lineno = int(methodline[1])
-                            await logger.debug(f'Calling {server_name}.{method_name}({kwargs}): {self.funcWrappers[method_name]}')
-                            retval = await self.funcWrappers[method_name].execute(lineno, **kwargs)
-                    return retval
-                return asyncio.create_task(foo(*args, **kwargs), name=f'Agentic-{inspect.stack()[0].function}:{inspect.stack()[1].lineno}')
-            function_stub_copy = types.FunctionType(function_stub.__code__.replace(co_name=cap.name), function_stub.__globals__, cap.name, function_stub.__defaults__, function_stub.__closure__)
-            function_stub_copy.__dict__.update(function_stub.__dict__)
-            return function_stub_copy
-        
-        if isinstance(cap, Capability):
-            setattr(self.__class__, cap.name, types.MethodType(create_foo(cap), self.__class__))
-            self.funcWrappers[cap.name] = MCPFunctionWrapper(self.mcp_server, cap, self.sse)
-        else:
-            raise ValueError(f'Invalid Capability Type: {type(cap)}')
-        return 
+    @classmethod
+    def reserved(cls, capname: str) -> bool:
+        """Names the wrapper itself uses (name, mcp_server, funcWrappers, sse, its methods and object's), a stub cannot replace them."""
+        return hasattr(cls, capname)
+    @classmethod
+    def compile(cls, name: str, mcp_server: Client, capabilities: list, result_cache: ResultCache | None = None, timeouts: dict | None = None) -> type:
+        namespace = {'__slots__': (), 'name': name, 'mcp_server': mcp_server}
+        funcWrappers = {}
+        for cap in capabilities:
+            if not isinstance(cap, Capability):
+                raise ValueError(f'Invalid Capability Type: {type(cap)}')
+            if cls.reserved(cap.name):
+                raise ValueError(f'{name}.{cap.name} collides with an attribute of the server wrapper')
+            funcWrappers[cap.name] = MCPFunctionWrapper(mcp_server, cap, name, result_cache, timeouts)
+            namespace[cap.name] = MCPServerWrapper.create_stub(cap.name)
+        namespace['funcWrappers'] = types.MappingProxyType(funcWrappers)
+        return type(name, (cls,), namespace)
+    @staticmethod
+    def create_stub(capname: str):
+        def function_stub(self, *args, **kwargs):
+            lineno = sys._getframe(1).f_lineno
+            task = asyncio.create_task(self.funcWrappers[capname].execute(self.sse, lineno, **kwargs), name=f'Agentic-{capname}:{lineno}')
+            # tracked so a cancelled workflow can also stop the calls it never awaited
+            self.sse.pending.add(task)
+            task.add_done_callback(self.sse.pending.discard)
+            return task
+        function_stub_copy = types.FunctionType(function_stub.__code__.replace(co_name=capname), function_stub.__globals__, capname, function_stub.__defaults__, function_stub.__closure__)
+        function_stub_copy.__dict__.update(function_stub.__dict__)
+        return function_stub_copy
     async def DEMO(self):
         await logger.error(f'Inspect=>{inspect.currentframe().f_code.co_name} function from {self.__class__.__name__}')
     
+class CompiledCodeCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        pass
+    def compile(self, code: str) -> types.CodeType:
+        key = hashlib.sha256(code.encode()).hexdigest()
+        compiled = self.entries.get(key)
+        if compiled is None:
+            self.misses += 1
+            compiled = compile(code, '<agentic>', 'exec')
+            self.entries[key] = compiled
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return compiled
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
 class MCPWrapper:
     builtin_function_names = ['Output', 'Sample', 'Wait']
-    def __init__(self, llm: AIWrapper, workflow_id: str):
-        self.event_stream = WorkflowEventStream()
+    canonical_funcname = 'PACHINKO_AGENTIC_WORKFLOW'
+    code_cache = CompiledCodeCache()
+    live_functions = weakref.WeakSet()
+    def __init__(self, llm: AIWrapper, workflow_id: str, servers: types.MappingProxyType | None = None, event_queue_size: int = 0, coalesce_updates: bool = False, process_pool = None, node_updates: bool = False, verbose_updates: bool = True, profile: bool = False, sampler: Sampler | None = None, validator = None):
+        self.event_stream = WorkflowEventStream(maxsize=event_queue_size, coalesce_updates=coalesce_updates)
         self.llm = llm
+        self.sampler = sampler if sampler is not None else Sampler(llm)
         self.funcname=None
         self.workflow_id = workflow_id
+        self.servers = servers if servers is not None else types.MappingProxyType({})
+        self.process_pool = process_pool
+        self.node_updates = node_updates
+        self.verbose_updates = verbose_updates
+        self.node_clock = {}
+        self.profiler = Profiler() if profile else None
+        self.pending = set()
+        self.validator = validator
+        self.validation = None
         return
+    def __getattr__(self, name: str):
+        servers = self.__dict__.get('servers')
+        if servers is None or name not in servers:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        server = servers[name](self)
+        self.__dict__[name] = server
+        return server
     @staticmethod
+    @functools.cache
     def builtins(prefix: str) -> str:
         swagger = "Built in functions:\n"
         for foo in MCPWrapper.builtin_function_names:
             swagger += f'Function: {prefix}.{getattr(MCPWrapper, foo).__name__}\n{getattr(MCPWrapper, foo).__doc__}'
         return swagger
-    def add_server_functions(self, servername: str, mcp_server: Client, capabilities: list) -> None:
-        svr_class = type(servername, (MCPServerWrapper,), {})
-        svr_obj = svr_class(servername, self, mcp_server)
-        setattr(self, servername, svr_obj)
-        for cap in capabilities:
-            getattr(self, servername).add_tool(cap)
-        return
-    async def is_harmless(self, code:str)->bool:
-        is_harmless = True
-        # Check for imports
-        # check for exec
-        return is_harmless
-    async def exec_agentic_function(self, funcname: str, code: str):
+    async def is_harmless(self, code:str, funcname: str | None = None)->bool:
+        if self.validator is None:
+            return True
+        self.validation = self.validator(code, funcname if funcname is not None else self.funcname)
+        return self.validation.valid
+    @staticmethod
+    def live_workflow_namespaces() -> int:
+        return len(MCPWrapper.live_functions)
+    async def exec_agentic_function(self, funcname: str, code: str, nodes: list | None = None, deadline: float | None = None):
         await logger.debug(funcname)
+        start = time.monotonic()
         await self.send_start()
+        if self.node_updates and nodes is not None:
+            for line in nodes:
+                await self.send_node_state(line, 'pending')
         self.funcname = funcname
-        async def load_as_module(modulename: str, modulecode:str) -> None:
-            try:
-                await logger.debug(f'Loading Module: {modulename}')
-                spec = importlib.util.spec_from_loader(modulename, loader=None)
-                module = importlib.util.module_from_spec(spec)
-                exec(modulecode, module.__dict__)
-                sys.modules[spec.name] = module
-            except Exception as e:
-                await logger.error(f'{modulename} Loader Exception: {e}')
-        async def purge_module(modulename:str) -> None:
-            if modulename in sys.modules:
-                await logger.debug(f'Purging Module: {modulename}')
-                module = sys.modules[modulename]
-                del sys.modules[modulename]
-                refcount = sys.getrefcount(module)
-                del module
-                if refcount > 2:
-                    await logger.warning(f'{modulename} LIKELY NOT PURGED')
-            return
-
+        namespace = {'__name__': funcname}
+        purged = None
+        timeout = asyncio.timeout(deadline)
         try:
-            if code is not None:
-                await load_as_module(funcname, code)
-                if funcname in sys.modules:
-                    await logger.debug(f'Found module {funcname}')
-                    foo = getattr(sys.modules[funcname], funcname)
-                    await logger.debug(f'Foo is {foo}')
-                    await foo(MCP=self)
-                await logger.debug('Done')
+            async with timeout:
+                if code is not None and not await self.is_harmless(code, funcname):
+                    await logger.error(f'{funcname} failed validation, not running it =>\n{self.validation}')
+                    await self.send_cancelled('invalid', time.monotonic()-start, [vars(error) for error in self.validation.errors])
+                elif code is not None and self.process_pool is not None:
+                    # runs in a worker process, MCP calls come back to this wrapper
+                    await self.process_pool.run(self, MCPWrapper.canonical_funcname, code.replace(funcname, MCPWrapper.canonical_funcname))
+                elif code is not None:
+                    # compile under a canonical name so the same plan in any workflow shares one code object
+                    exec(MCPWrapper.code_cache.compile(code.replace(funcname, MCPWrapper.canonical_funcname)), namespace)
+                    MCPWrapper.live_functions.add(namespace[MCPWrapper.canonical_funcname])
+                    purged = weakref.ref(namespace[MCPWrapper.canonical_funcname])
+                    await logger.debug('Foo is %s', purged())
+                    await namespace[MCPWrapper.canonical_funcname](MCP=self)
+                    await logger.debug('Done')
+        except asyncio.CancelledError:
+            await logger.info(f'{funcname} cancelled after {time.monotonic()-start:.2f} seconds')
+            await self.cancel_pending()
+            await self.send_cancelled('cancelled', time.monotonic()-start)
+            raise
         except Exception as e:
-            await logger.error(f'Agentic code failed => {type(e)}:{e}')
+            await self.cancel_pending()
+            if timeout.expired():
+                await logger.warning(f'{funcname} exceeded its {deadline} second deadline')
+                await self.send_cancelled('deadline', time.monotonic()-start)
+            else:
+                await logger.error(f'Agentic code failed => {type(e)}:{e}')
         finally:
-            await purge_module(funcname)
+            namespace.clear()
+            if purged is not None and purged() is not None:
+                await logger.warning(f'{funcname} LIKELY NOT PURGED, {MCPWrapper.live_workflow_namespaces()} workflow namespaces alive')
             await self.send_end()
+    async def cancel_pending(self) -> None:
+        pending = list(self.pending)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return
     async def send_start(self):
         await logger.debug('Sending Start Event')
         await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_START, workflow_id=self.workflow_id, extra_data=None))
@@ -144,26 +235,50 @@ class MCPWrapper:
         return
     async def send_end(self):
         await logger.debug('Sending End Event')
-        await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_END, workflow_id=self.workflow_id, extra_data=None))
+        await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_END, workflow_id=self.workflow_id, extra_data=self.profiler.report() if self.profiler is not None else None))
         await logger.debug('Back')
         return
-    async def send_update(self, update: str, hover: str = '', lineno: int = None):
+    async def send_cancelled(self, reason: str, elapsed: float, errors: list | None = None):
+        extra_data = {'reason': reason, 'elapsed': round(elapsed, 3)}
+        if errors is not None:
+            extra_data['errors'] = errors
+        await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_CANCELLED, workflow_id=self.workflow_id, extra_data=extra_data))
+        return
+    async def send_update(self, update: str, hover: str = '', lineno: int = None, state: str | None = None):
         await logger.debug('Sending Update Event')
         if lineno is None:
-            line = inspect.stack()[2].lineno
+            line = sys._getframe(2).f_lineno
         else:
             line = lineno
-        await logger.debug(f'Lineno: [{line}]')
-        await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_UPDATE, workflow_id=self.workflow_id, extra_data={'line': line, 'update': update, 'hover':hover}))
+        await logger.debug('Lineno: [%s]', line)
+        if self.verbose_updates:
+            await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_UPDATE, workflow_id=self.workflow_id, extra_data={'line': line, 'update': update, 'hover':hover}))
+        if self.node_updates and state is not None:
+            await self.send_node_state(line, state)
         await logger.debug('Back')
         return
+    async def send_node_state(self, line: int, state: str):
+        # one delta per change of the flowchart symbol id="line{line}", calls overlapping on a line (a loop) count as one
+        now = time.monotonic()
+        active, started = self.node_clock.get(line, (0, now))
+        if state == 'running':
+            self.node_clock[line] = (active + 1, started if active > 0 else now)
+            if active > 0:
+                return
+            started = now
+        elif state in ('done', 'failed', 'cancelled', 'timeout'):
+            self.node_clock[line] = (max(active - 1, 0), started)
+            if state == 'done' and active > 1:
+                return
+        await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.NODE_STATE, workflow_id=self.workflow_id, extra_data={'id': f'line{line}', 'state': state, 'elapsed': round(now - started, 3)}))
+        return
     async def send_answer(self, update: str, lineno: int = None):
         await logger.debug('Sending Answer Event')
         if lineno is None:
-            line = inspect.stack()[2].lineno
+            line = sys._getframe(2).f_lineno
         else:
             line = lineno
-        await logger.debug(f'Lineno: [{line}]')
+        await logger.debug('Lineno: [%s]', line)
         await self.event_stream.put(WorkflowEvent(event_type=WorkflowEventType.ANSWER_UPDATE, workflow_id=self.workflow_id, extra_data={'line': line, 'update': update}))
         await logger.debug('Back')
         return
@@ -173,49 +288,77 @@ class MCPWrapper:
         Returns: array of results from the coroutine parameters
         '''
         start = time.time()
-        await self.send_update('Beginning Gather', hover="Waiting for this group of requests to return.")
-        results = await asyncio.gather(*args)
-        await self.send_update('Returned from Gather', hover=f"Time: {time.time()-start:.2f} seconds.")
+        lineno = sys._getframe(1).f_lineno
+        await self.send_update('Beginning Gather', hover="Waiting for this group of requests to return.", lineno=lineno, state='running')
+        try:
+            results = await asyncio.gather(*args)
+        except (Exception, asyncio.CancelledError) as e:
+            if self.profiler is not None:
+                self.profiler.record(lineno, 'MCP.Wait', time.time()-start, wait=time.time()-start, failed=True)
+            if isinstance(e, asyncio.CancelledError):
+                await self.send_update('Cancelled Gather', hover=f"Time: {time.time()-start:.2f} seconds.", lineno=lineno, state='cancelled')
+                raise
+            # nothing will read the rest of the group once one of them has failed
+            for arg in args:
+                if asyncio.isfuture(arg):
+                    arg.cancel()
+            await self.send_update('Failed Gather', hover=f"{type(e)}:{e}\nTime: {time.time()-start:.2f} seconds.", lineno=lineno, state='failed')
+            raise
+        if self.profiler is not None:
+            self.profiler.record(lineno, 'MCP.Wait', time.time()-start, wait=time.time()-start)
+        await self.send_update('Returned from Gather', hover=f"Time: {time.time()-start:.2f} seconds.", lineno=lineno, state='done')
         return results
     async def Output(self, output_string: str) -> None:
         '''Description: This function sends a result to the user.  It should be used instead of print().
         Parameters: <output_string: str>
         Returns: None
         '''
-        await logger.debug(f'Self is {type(self)}')
-        await logger.debug(f'OUTPUT CALLED ({output_string})')
-        lineno = inspect.stack()[1].lineno
-        await self.send_update('Beginning Output', lineno=lineno, hover='This function prints part of the final answer.')
-        await self.send_answer(output_string)
-        await self.send_update('Returned from Output', lineno=lineno)
+        await self.output(output_string, sys._getframe(1).f_lineno)
+        return
+    async def output(self, output_string: str, lineno: int) -> None:
+        start = time.time()
+        await logger.debug('Self is %s', type(self))
+        await logger.debug('OUTPUT CALLED (%s)', output_string)
+        await self.send_update('Beginning Output', lineno=lineno, hover='This function prints part of the final answer.', state='running')
+        await self.send_answer(output_string, lineno=lineno)
+        if self.profiler is not None:
+            self.profiler.record(lineno, 'MCP.Output', time.time()-start)
+        await self.send_update('Returned from Output', lineno=lineno, state='done')
         return
     async def Sample(self, llm_question: str) -> str:
         '''Description: This function should be used if you cannot figure out a method of answering the user's question using the available library of functions.
         Parameters: <llm_question: str>
         Returns: str
         '''
+        caller = sys._getframe(1)
+        return await self.sample(llm_question, caller.f_lineno, caller.f_code.co_name)
+    async def sample(self, llm_question: str, lineno: int, fname: str) -> str:
         start = time.time()
-        await logger.debug(f'Self is {type(self)}')
-        lineno = inspect.stack()[1].lineno
-        fname = inspect.stack()[1].function
-        await self.send_update('Beginning LLM Sample', lineno=lineno, hover='Making a call to the LLM.')
-        await logger.debug(f'[{fname}:{lineno}] SAMPLE CALLED ({llm_question})')
-        response = await self.llm.get_response(system_prompt='''Respond to this question in HTML format.  Wrap the HTML in tags so that the final response looks like this:
-        [STARTANSWER]
-        <HTML formatted answer to the question goes here>
-        [ENDANSWER]
-
-        The HTML provided between the STARTANSWER and ENDANSWER tags will be inserted into an existing <DIV> block.
-        ''',
-                                                question=llm_question,
-                                                include_thinking=True)
+        await logger.debug('Self is %s', type(self))
+        await self.send_update('Beginning LLM Sample', lineno=lineno, hover='Making a call to the LLM.', state='running')
+        await logger.debug('[%s:%s] SAMPLE CALLED (%s)', fname, lineno, llm_question)
+        try:
+            response, cached = await self.sampler.sample(SAMPLE_SYSTEM_PROMPT, llm_question)
+        except (Exception, asyncio.CancelledError) as e:
+            if self.profiler is not None:
+                self.profiler.record(lineno, 'MCP.Sample', time.time()-start, failed=True)
+            if isinstance(e, asyncio.CancelledError):
+                await self.send_update('Cancelled LLM Sample', lineno=lineno, hover=f'Time: {time.time()-start:.2f} seconds.', state='cancelled')
+                raise
+            await self.send_update('Failed LLM Sample', lineno=lineno, hover=f'{type(e)}:{e}\nTime: {time.time()-start:.2f} seconds.', state='failed')
+            raise
         try:
             answer = response.answer.split('[STARTANSWER]')[1].lstrip().split('[ENDANSWER]')[0]
         except Exception as e:
             await logger.debug(response.answer)
             answer = f'LLM was unable to provide an answer to the question [{response.answer}].'
         finally:
-            await self.send_update('Received LLM Sample', lineno=lineno, hover=f'Prompt Tokens:{response.prompt_token_use}\nCompletionTokens:{response.completion_token_use}\nTime: {time.time()-start:.2f} seconds.')
+            # only the sample that went to the LLM used tokens
+            used = cached is None or cached == 'miss'
+            if self.profiler is not None:
+                self.profiler.record(lineno, 'MCP.Sample', time.time()-start, prompt_tokens=response.prompt_token_use if used else 0, completion_tokens=response.completion_token_use if used else 0)
+            hover = f'Prompt Tokens:{response.prompt_token_use}\nCompletionTokens:{response.completion_token_use}\nTime: {time.time()-start:.2f} seconds.'
+            await self.send_update('Received LLM Sample', lineno=lineno, hover=hover if cached is None else f'Cache {cached}.\n{hover}', state='done')
             return answer
 
             
\ No newline at end of file
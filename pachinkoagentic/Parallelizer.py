@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Rewrites generated agentic workflow functions so that consecutive awaited MCP calls that do not depend on
+  each other run together in a single MCP.Wait(...).  The dependencies come from a def-use pass over the
+  names each call reads and the names its statement assigns.  Calls to the same server stay in order
+  unless both capabilities are read only.
+
+The rewrite is done in place on the source text.  Every call of a batch stays on its own line, now only
+  starting its task, and the MCP.Wait that gathers the batch is inserted on a new line after it, so each
+  call and each Wait is a node with a line of its own in the flowchart, the events and the profile.
+"""
+
+import ast
+from dataclasses import dataclass
+from typing import Callable
+from .MCPWrapper import MCPWrapper
+
+@dataclass
+class ParallelPlan:
+    code: str
+    batches: int
+    calls_batched: int
+    critical_path_before: int
+    critical_path_after: int
+
+@dataclass
+class _MCPStatement:
+    statement: ast.stmt
+    call: ast.Call
+    server: str
+    capname: str
+    target: str
+    reads: set
+    writes: set
+
+class Parallelizer:
+    def __init__(self, package: str = 'MCP', read_only: Callable[[str, str], bool] | None = None):
+        self.package = package
+        self.read_only = read_only if read_only is not None else (lambda server, capname: False)
+        pass
+    def rewrite(self, code: str) -> ParallelPlan:
+        tree = ast.parse(code)
+        before = Parallelizer.critical_path(tree)
+        batches = []
+        for node in tree.body:
+            if isinstance(node, ast.AsyncFunctionDef):
+                self._collect(node.body, code, batches)
+        if len(batches) == 0:
+            return ParallelPlan(code, 0, 0, before, before)
+        lines = [line.encode() for line in code.split('\n')]
+        for batch in reversed(batches):
+            self._apply(batch, code, lines)
+        code = '\n'.join(line.decode() for line in lines)
+        return ParallelPlan(code, len(batches), sum(len(batch) for batch in batches), before, Parallelizer.critical_path(ast.parse(code)))
+    @staticmethod
+    def critical_path(tree: ast.AST) -> int:
+        # every await is one sequential round trip, a Wait counts once however many calls it gathers
+        return sum(1 for node in ast.walk(tree) if isinstance(node, ast.Await))
+    def _collect(self, body: list, code: str, batches: list) -> None:
+        current = []
+        def flush():
+            if len(current) > 1:
+                batches.append(list(current))
+            current.clear()
+        for statement in body:
+            candidate = self._mcp_statement(statement, code)
+            if candidate is None:
+                flush()
+                for field in ('body', 'orelse', 'finalbody'):
+                    if isinstance(getattr(statement, field, None), list):
+                        self._collect(getattr(statement, field), code, batches)
+                for handler in getattr(statement, 'handlers', []):
+                    self._collect(handler.body, code, batches)
+                continue
+            if self._conflicts(candidate, current):
+                flush()
+            current.append(candidate)
+        flush()
+        return
+    def _conflicts(self, candidate: _MCPStatement, batch: list) -> bool:
+        for member in batch:
+            if candidate.reads & member.writes or candidate.writes & member.writes:
+                return True
+            if candidate.server == member.server and not (self.read_only(candidate.server, candidate.capname) and self.read_only(member.server, member.capname)):
+                return True
+            if candidate.statement.lineno <= member.statement.end_lineno:
+                return True
+        return False
+    def _mcp_statement(self, statement: ast.stmt, code: str) -> _MCPStatement | None:
+        if isinstance(statement, ast.Expr):
+            target = None
+        elif isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+            target = statement.targets[0]
+        else:
+            return None
+        if not isinstance(statement.value, ast.Await) or not isinstance(statement.value.value, ast.Call):
+            return None
+        call = statement.value.value
+        func = call.func
+        if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Attribute) and isinstance(func.value.value, ast.Name)):
+            return None
+        if func.value.value.id != self.package or func.value.attr in MCPWrapper.builtin_function_names:
+            return None
+        if call.lineno != statement.lineno or any(isinstance(node, (ast.Await, ast.NamedExpr, ast.Lambda)) for node in ast.walk(call)):
+            return None
+        writes = set()
+        if target is not None:
+            names = target.elts if isinstance(target, (ast.Tuple, ast.List)) else [target]
+            if not all(isinstance(name, ast.Name) for name in names):
+                return None
+            writes = {name.id for name in names}
+        lines = code.split('\n')
+        # must be the only statement on its lines, a trailing comment is fine
+        if lines[statement.lineno-1].encode()[:statement.col_offset].strip() != b'':
+            return None
+        tail = lines[statement.end_lineno-1].encode()[statement.end_col_offset:].strip()
+        if tail != b'' and not tail.startswith(b'#'):
+            return None
+        reads = {node.id for node in ast.walk(call) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+        return _MCPStatement(statement, call, func.value.attr, func.attr,
+                             ast.get_source_segment(code, target) if target is not None else '_', reads, writes)
+    def _apply(self, batch: list, code: str, lines: list) -> None:
+        targets = ', '.join(f'({member.target})' if ',' in member.target else member.target for member in batch)
+        tasks = []
+        for member in batch:
+            statement = member.statement
+            # a plain name holds its task until the Wait replaces it with the result
+            task = member.target if isinstance(statement, ast.Assign) and isinstance(statement.targets[0], ast.Name) else f'_wait{statement.lineno}'
+            tasks.append(task)
+            text = f'{task} = {ast.get_source_segment(code, member.call)}'
+            first = lines[statement.lineno-1]
+            last = lines[statement.end_lineno-1]
+            lines[statement.lineno-1:statement.end_lineno] = (first[:statement.col_offset] + text.encode() + last[statement.end_col_offset:]).split(b'\n')
+        indent = lines[batch[0].statement.lineno-1][:batch[0].statement.col_offset]
+        lines.insert(batch[-1].statement.end_lineno, indent + f'{targets} = await {self.package}.Wait({", ".join(tasks)})'.encode())
+        return
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Caches generated workflow plans (the python function and its flowchart SVG) so that repeated questions against
+  an unchanged library skip the call to the agentic code generator.  Keys are the normalized question plus the
+  library catalog hash.
+"""
+
+import asyncio
+import collections
+import hashlib
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+
+class PlanCache(ABC):
+    funcname_placeholder = '__PACHINKO_AGENTIC_FUNCNAME__'
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        pass
+    @staticmethod
+    def key(question: str, catalog_hash: str) -> str:
+        normalized = ' '.join(question.lower().split()).rstrip('?.! ')
+        return hashlib.sha256(f'{catalog_hash}\n{normalized}'.encode()).hexdigest()
+    async def get(self, key: str) -> tuple[str, str] | None:
+        plan = await self._get(key)
+        if plan is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return plan
+    async def put(self, key: str, code: str, image: str) -> None:
+        if len(code) + len(image) <= self.max_bytes:
+            await self._put(key, code, image)
+        return
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups > 0 else 0.0, 'entries': self._entries(), 'bytes': self._bytes()}
+    @abstractmethod
+    async def _get(self, key: str) -> tuple[str, str] | None:
+        ...
+    @abstractmethod
+    async def _put(self, key: str, code: str, image: str) -> None:
+        ...
+    @abstractmethod
+    def _entries(self) -> int:
+        ...
+    @abstractmethod
+    def _bytes(self) -> int:
+        ...
+
+class MemoryPlanCache(PlanCache):
+    def __init__(self, max_bytes: int = 16*1024*1024):
+        super().__init__(max_bytes)
+        self.plans = collections.OrderedDict()
+        self.size = 0
+        pass
+    async def _get(self, key: str) -> tuple[str, str] | None:
+        plan = self.plans.get(key)
+        if plan is not None:
+            self.plans.move_to_end(key)
+        return plan
+    async def _put(self, key: str, code: str, image: str) -> None:
+        if key in self.plans:
+            old_code, old_image = self.plans.pop(key)
+            self.size -= len(old_code) + len(old_image)
+        self.plans[key] = (code, image)
+        self.size += len(code) + len(image)
+        while self.size > self.max_bytes:
+            _, (old_code, old_image) = self.plans.popitem(last=False)
+            self.size -= len(old_code) + len(old_image)
+        return
+    def _entries(self) -> int:
+        return len(self.plans)
+    def _bytes(self) -> int:
+        return self.size
+
+class SQLitePlanCache(PlanCache):
+    def __init__(self, path: str, max_bytes: int = 256*1024*1024):
+        super().__init__(max_bytes)
+        self.path = os.path.abspath(path)
+        self.entries = 0
+        self.size = 0
+        with sqlite3.connect(self.path) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, code TEXT, image TEXT, size INTEGER, used REAL)')
+            self.entries, self.size = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM plans').fetchone()
+        db.close()
+        pass
+    def __get(self, key: str) -> tuple[str, str] | None:
+        with sqlite3.connect(self.path) as db:
+            plan = db.execute('SELECT code, image FROM plans WHERE key = ?', (key,)).fetchone()
+            if plan is not None:
+                db.execute('UPDATE plans SET used = ? WHERE key = ?', (time.time(), key))
+        db.close()
+        return plan
+    def __put(self, key: str, code: str, image: str) -> None:
+        with sqlite3.connect(self.path) as db:
+            db.execute('INSERT OR REPLACE INTO plans (key, code, image, size, used) VALUES (?, ?, ?, ?, ?)', (key, code, image, len(code) + len(image), time.time()))
+            self.entries, self.size = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM plans').fetchone()
+            while self.size > self.max_bytes:
+                oldest = db.execute('SELECT key, size FROM plans ORDER BY used LIMIT 1').fetchone()
+                db.execute('DELETE FROM plans WHERE key = ?', (oldest[0],))
+                self.entries -= 1
+                self.size -= oldest[1]
+        db.close()
+        return
+    async def _get(self, key: str) -> tuple[str, str] | None:
+        return await asyncio.to_thread(self.__get, key)
+    async def _put(self, key: str, code: str, image: str) -> None:
+        await asyncio.to_thread(self.__put, key, code, image)
+        return
+    def _entries(self) -> int:
+        return self.entries
+    def _bytes(self) -> int:
+        return self.size
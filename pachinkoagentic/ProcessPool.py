@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Runs generated agentic workflow functions in a pool of pre-warmed worker processes so that CPU heavy
+  generated code cannot stall the event loop that serves every other workflow.
+
+Inside the worker the function receives a proxy in place of the MCPWrapper.  MCP calls, Output and Sample
+  are sent back over a pipe and executed by the parent's MCPWrapper on its pooled MCP sessions, so the
+  WORKFLOW_UPDATE and ANSWER_UPDATE events are produced exactly as they are for in-process execution.
+  Each end of a pipe has a reader and a writer thread, so the event loop never blocks in send or recv
+  (on any platform's event loop) and two large messages crossing in opposite directions cannot deadlock.
+
+await start() spawns the workers and returns once every one has reported ready, run() starts the pool on
+  first use otherwise.  Workers are replaced after a fixed number of runs to cap memory growth, the
+  replacement is spawned in the background while the next run takes an idle worker.
+"""
+
+from .Logging import get_async_logger
+logger = get_async_logger(__name__, 'INFO')
+
+import asyncio
+import itertools
+import multiprocessing
+import multiprocessing.reduction
+import os
+import queue
+import sys
+import threading
+import time
+
+class _Pipe:
+    """One end of a worker connection.  Messages are pickled by send() so errors surface to the caller, then
+    written by a thread.  Another thread receives into messages, ending with closed_message on EOF."""
+    def __init__(self, conn, closed_message: tuple):
+        self.conn = conn
+        self.loop = asyncio.get_running_loop()
+        self.messages = asyncio.Queue()
+        self.closed_message = closed_message
+        self.closed = False
+        self._outgoing = queue.SimpleQueue()
+        self.reader = threading.Thread(target=self._read, daemon=True, name='PachinkoAgenticPipeReader')
+        self.writer = threading.Thread(target=self._write, daemon=True, name='PachinkoAgenticPipeWriter')
+        self.reader.start()
+        self.writer.start()
+        pass
+    def _read(self) -> None:
+        try:
+            while True:
+                message = self.conn.recv()
+                self.loop.call_soon_threadsafe(self.messages.put_nowait, message)
+        except (EOFError, OSError):
+            pass
+        except RuntimeError:
+            return # the event loop has already closed
+        try:
+            self.loop.call_soon_threadsafe(self.messages.put_nowait, self.closed_message)
+        except RuntimeError:
+            pass
+        return
+    def _write(self) -> None:
+        while True:
+            data = self._outgoing.get()
+            if data is None:
+                return
+            try:
+                self.conn.send_bytes(data)
+            except (EOFError, OSError):
+                return # the other end is gone, the reader reports it
+    def send(self, message: tuple) -> None:
+        self._outgoing.put(bytes(multiprocessing.reduction.ForkingPickler.dumps(message)))
+        return
+    def flush(self, timeout: float) -> None:
+        """Blocking, for the worker on its way out: writes what is queued and stops the writer."""
+        self._outgoing.put(None)
+        self.writer.join(timeout)
+        return
+    async def close(self) -> None:
+        """Once the other process has exited, both threads finish promptly and the connection is closed."""
+        if self.closed:
+            return
+        self.closed = True
+        self._outgoing.put(None)
+        while self.reader.is_alive() or self.writer.is_alive():
+            await asyncio.sleep(0.01)
+        self.conn.close()
+        return
+
+# Worker side
+
+class _Channel:
+    def __init__(self, pipe: _Pipe):
+        self.pipe = pipe
+        self.pending = {}
+        self._ids = itertools.count()
+        pass
+    async def request(self, kind: str, *payload) -> object:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.pipe.send(('request', request_id, kind, payload))
+        return await future
+    def notify(self, kind: str, *payload) -> None:
+        self.pipe.send(('notify', None, kind, payload))
+        return
+    def reply(self, request_id: int, ok: bool, value: object) -> None:
+        future = self.pending.pop(request_id, None)
+        if future is not None and not future.done():
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+        return
+
+class RemoteServer:
+    def __init__(self, channel: _Channel, name: str):
+        self._channel = channel
+        self._name = name
+        pass
+    def __getattr__(self, capname: str):
+        if capname.startswith('__'):
+            raise AttributeError(capname)
+        channel = self._channel
+        server = self._name
+        def function_stub(*args, **kwargs):
+            lineno = sys._getframe(1).f_lineno
+            return asyncio.ensure_future(channel.request('call', server, capname, lineno, kwargs))
+        return function_stub
+
+class RemoteMCP:
+    def __init__(self, channel: _Channel):
+        self._channel = channel
+        pass
+    def __getattr__(self, name: str):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        server = RemoteServer(self._channel, name)
+        self.__dict__[name] = server
+        return server
+    async def Wait(self, *args):
+        # gathered locally, only the progress updates go back to the parent
+        start = time.time()
+        lineno = sys._getframe(1).f_lineno
+        self._channel.notify('update', 'Beginning Gather', "Waiting for this group of requests to return.", lineno, 'running')
+        try:
+            results = await asyncio.gather(*args)
+        except Exception as e:
+            self._channel.notify('profile', lineno, 'MCP.Wait', time.time()-start, 0.0, time.time()-start, 0, 0, True)
+            self._channel.notify('update', 'Failed Gather', f"{type(e)}:{e}\nTime: {time.time()-start:.2f} seconds.", lineno, 'failed')
+            raise
+        self._channel.notify('profile', lineno, 'MCP.Wait', time.time()-start, 0.0, time.time()-start)
+        self._channel.notify('update', 'Returned from Gather', f"Time: {time.time()-start:.2f} seconds.", lineno, 'done')
+        return results
+    async def Output(self, output_string: str) -> None:
+        return await self._channel.request('output', output_string, sys._getframe(1).f_lineno)
+    async def Sample(self, llm_question: str) -> str:
+        caller = sys._getframe(1)
+        return await self._channel.request('sample', llm_question, caller.f_lineno, caller.f_code.co_name)
+
+async def _worker_run(channel: _Channel, code_cache, funcname: str, code: str) -> None:
+    namespace = {'__name__': funcname}
+    error = None
+    try:
+        exec(code_cache.compile(code), namespace)
+        await namespace[funcname](MCP=RemoteMCP(channel))
+    except Exception as e:
+        error = f'{type(e)}:{e}'
+    finally:
+        namespace.clear()
+        channel.pipe.send(('done', None, error, None))
+    return
+
+async def _worker_loop(conn) -> None:
+    from .MCPWrapper import CompiledCodeCache
+    code_cache = CompiledCodeCache()
+    pipe = _Pipe(conn, ('stop',))
+    channel = _Channel(pipe)
+    running = None
+    pipe.send(('ready', None, os.getpid(), None))
+    while True:
+        message = await pipe.messages.get()
+        if message[0] == 'stop':
+            break
+        elif message[0] == 'reply':
+            channel.reply(*message[1:])
+        elif message[0] == 'run':
+            running = asyncio.ensure_future(_worker_run(channel, code_cache, *message[1:]))
+    if running is not None and not running.done():
+        running.cancel()
+    pipe.flush(5)
+    return
+
+def _worker_main(conn) -> None:
+    try:
+        asyncio.run(_worker_loop(conn))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    return
+
+# Parent side
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,), daemon=True, name='PachinkoAgenticWorker')
+        self.process.start()
+        child.close()
+        self.pipe = _Pipe(self.conn, ('exited', None, None, None))
+        self.runs = 0
+        self.broken = False
+        pass
+    async def receive(self) -> tuple:
+        message = await self.pipe.messages.get()
+        if message[0] == 'exited':
+            self.pipe.messages.put_nowait(message) # every later receive fails the same way
+            raise EOFError(f'Worker {self.process.pid} exited with code {self.process.exitcode}')
+        return message
+    async def ready(self, timeout: float) -> None:
+        message = await asyncio.wait_for(self.receive(), timeout)
+        if message[0] != 'ready':
+            raise RuntimeError(f'Worker {self.process.pid} sent {message[0]} before it was ready')
+        return
+    async def run(self, runner, funcname: str, code: str) -> str | None:
+        self.runs += 1
+        tasks = set()
+        try:
+            self.pipe.send(('run', funcname, code))
+            while True:
+                message = await self.receive()
+                if message[0] == 'done':
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    return message[2]
+                elif message[0] == 'notify':
+                    # handled inline so the updates keep their order relative to each other
+                    if message[2] == 'profile':
+                        if runner.profiler is not None:
+                            runner.profiler.record(*message[3])
+                    else:
+                        await runner.send_update(*message[3])
+                else:
+                    task = asyncio.ensure_future(self._serve(runner, message[1], message[2], message[3]))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except BaseException:
+            # the worker may still be running the function, it cannot be reused
+            self.broken = True
+            for task in tasks:
+                task.cancel()
+            raise
+    async def _serve(self, runner, request_id: int, kind: str, payload: tuple) -> None:
+        try:
+            if kind == 'call':
+                server, capname, lineno, kwargs = payload
+                wrapper = runner.servers[server].funcWrappers.get(capname)
+                if wrapper is None:
+                    raise AttributeError(f"'{server}' has no function '{capname}'")
+                value = await wrapper.execute(runner, lineno, **kwargs)
+            elif kind == 'output':
+                value = await runner.output(*payload)
+            elif kind == 'sample':
+                value = await runner.sample(*payload)
+            else:
+                raise ValueError(f'Unknown request {kind}')
+            reply = ('reply', request_id, True, value)
+        except Exception as e:
+            reply = ('reply', request_id, False, f'{type(e)}:{e}')
+        if not self.broken:
+            try:
+                self.pipe.send(reply)
+            except Exception as e:
+                self.pipe.send(('reply', request_id, False, f'Result could not be sent to the worker => {type(e)}:{e}'))
+        return
+    async def join(self, timeout: float | None = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.process.is_alive() and (deadline is None or time.monotonic() < deadline):
+            await asyncio.sleep(0.01)
+        return
+    async def stop(self) -> None:
+        if self.pipe.closed:
+            return
+        if not self.broken and self.process.is_alive():
+            self.pipe.send(('stop',))
+            await self.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            await self.join()
+        await self.pipe.close()
+        return
+
+class ProcessPool:
+    def __init__(self, workers: int = 2, max_runs_per_worker: int = 100, start_method: str = 'spawn', ready_timeout: float = 30.0):
+        self.workers = workers
+        self.max_runs_per_worker = max_runs_per_worker
+        self.ready_timeout = ready_timeout
+        self.context = multiprocessing.get_context(start_method)
+        self.idle = None
+        self.all = set()
+        self.starting = None
+        self.replacing = set()
+        self.recycled = 0
+        pass
+    async def start(self) -> None:
+        """Spawns the workers and waits until each one is ready, concurrent callers share the same start."""
+        if self.starting is None:
+            self.idle = asyncio.Queue()
+            self.starting = asyncio.ensure_future(self._start_workers())
+        try:
+            await asyncio.shield(self.starting)
+        except Exception:
+            await self.close()
+            raise
+        return
+    async def _start_workers(self) -> None:
+        tasks = [asyncio.ensure_future(self._add_worker()) for i in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return
+    async def _add_worker(self) -> None:
+        # only workers that reported ready are counted, one still starting is stopped if its task is cancelled
+        worker = _Worker(self.context)
+        try:
+            await worker.ready(self.ready_timeout)
+        except BaseException:
+            await worker.stop()
+            raise
+        self.all.add(worker)
+        self.idle.put_nowait(worker)
+        return
+    def _replace(self, retired: _Worker | None = None) -> None:
+        task = asyncio.ensure_future(self._spawn(retired))
+        self.replacing.add(task)
+        task.add_done_callback(self.replacing.discard)
+        return
+    async def _spawn(self, retired: _Worker | None) -> None:
+        try:
+            await asyncio.gather(*([retired.stop()] if retired is not None else []), self._add_worker())
+        except Exception as e:
+            # the next run tries again
+            await logger.warning(f'Starting a replacement worker failed => {type(e)}:{e}')
+        return
+    async def run(self, runner, funcname: str, code: str) -> None:
+        await self.start()
+        for i in range(self.workers - len(self.all) - len(self.replacing)):
+            self._replace()
+        worker = await self.idle.get()
+        while not worker.process.is_alive():
+            # died while idle, never hand it a function
+            self.all.discard(worker)
+            self.recycled += 1
+            self._replace(worker)
+            worker = await self.idle.get()
+        try:
+            error = await worker.run(runner, funcname, code)
+        finally:
+            if worker.broken or not worker.process.is_alive() or worker.runs >= self.max_runs_per_worker:
+                await logger.debug('Recycling worker %s after %s runs', worker.process.pid, worker.runs)
+                self.all.discard(worker)
+                self.recycled += 1
+                self._replace(worker)
+            else:
+                self.idle.put_nowait(worker)
+        if error is not None:
+            raise RuntimeError(error)
+        return
+    def stats(self) -> dict:
+        return {'workers': len(self.all), 'idle': self.idle.qsize() if self.idle is not None else 0, 'replacing': len(self.replacing), 'recycled': self.recycled}
+    async def close(self) -> None:
+        tasks = list(self.replacing) + ([self.starting] if self.starting is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        workers = list(self.all)
+        self.all.clear()
+        self.idle = None
+        self.starting = None
+        await asyncio.gather(*[worker.stop() for worker in workers])
+        return
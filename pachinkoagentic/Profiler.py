@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Structured timing for a run of an agentic workflow.  The MCPWrapper records every MCP call, Wait, Output and
+  Sample against both the generated code line and the server.tool (or MCP.builtin) that was called.
+  The report is sent with WORKFLOW_END, can shade the Flowchart as a latency heatmap and can be folded
+  into a ProfileAggregator to find the slowest tools across many runs.
+"""
+
+import collections
+import time
+
+def _stats() -> dict:
+    return {'calls': 0, 'wall': 0.0, 'max': 0.0, 'queued': 0.0, 'wait': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0, 'failures': 0}
+
+class Profiler:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.lines = collections.defaultdict(_stats)
+        self.tools = collections.defaultdict(_stats)
+        self.generation = None
+        pass
+    def record(self, lineno: int, name: str, wall: float, queued: float = 0.0, wait: float = 0.0,
+               prompt_tokens: int = 0, completion_tokens: int = 0, failed: bool = False) -> None:
+        for stats in (self.lines[lineno], self.tools[name]):
+            stats['calls'] += 1
+            stats['wall'] += wall
+            stats['max'] = max(stats['max'], wall)
+            stats['queued'] += queued
+            stats['wait'] += wait
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['failures'] += failed
+        return
+    def report(self) -> dict:
+        return {'wall': time.monotonic() - self.started,
+                'lines': {lineno: dict(stats) for lineno, stats in sorted(self.lines.items())},
+                'tools': {name: dict(stats) for name, stats in self.tools.items()},
+                'generation': self.generation}
+    def heatmap(self) -> dict:
+        return {lineno: stats['wall'] for lineno, stats in self.lines.items()}
+
+class ProfileAggregator:
+    def __init__(self, samples: int = 1000):
+        self.runs = 0
+        self.tools = collections.defaultdict(_stats)
+        self.walls = collections.defaultdict(lambda: collections.deque(maxlen=samples))
+        pass
+    def add(self, report: dict) -> None:
+        self.runs += 1
+        for name, stats in report['tools'].items():
+            total = self.tools[name]
+            for key, value in stats.items():
+                total[key] = max(total[key], value) if key == 'max' else total[key] + value
+            if stats['calls'] > 0:
+                self.walls[name].append(stats['wall'] / stats['calls'])
+        return
+    def slowest_tools(self, top_n: int = 10) -> list:
+        slowest = []
+        for name, stats in self.tools.items():
+            walls = sorted(self.walls[name])
+            slowest.append({'tool': name, 'calls': stats['calls'], 'mean': stats['wall'] / max(stats['calls'], 1),
+                            'p95': walls[int(0.95 * (len(walls) - 1))] if len(walls) > 0 else 0.0, 'max': stats['max'],
+                            'queued': stats['queued'] / max(stats['calls'], 1), 'failures': stats['failures']})
+        slowest.sort(key=lambda tool: tool['mean'], reverse=True)
+        return slowest[:top_n]
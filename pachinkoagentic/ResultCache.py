@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Memoizes MCP tool results across every workflow that shares a Library.  Keys are the server, the tool and the
+  canonical JSON of the arguments.  Whether a tool is cached comes from the policies given to the cache
+  ('server.tool' or 'server.*' => TTL in seconds, 0 or None to never cache, or a CachePolicy so a tool with
+  side effects can set dedupe=False and send every call upstream) and otherwise from the tool's MCP
+  annotations: read only tools are cached for the default TTL, idempotent ones only share a single upstream
+  request between identical calls that are in flight at the same time.  Resources and prompts carry no
+  annotations and are only cached when a policy names them.
+"""
+
+from .Logging import get_async_logger
+logger = get_async_logger(__name__, 'INFO')
+
+import asyncio
+import collections
+import copy
+import json
+import time
+from .Capabilities import Capability, Tool
+
+class CachePolicy:
+    def __init__(self, ttl: float | None, dedupe: bool):
+        self.ttl = ttl
+        self.dedupe = dedupe
+        pass
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 60.0, policies: dict | None = None, use_annotations: bool = True):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.policies = policies or {}
+        self.use_annotations = use_annotations
+        self.entries = collections.OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.evictions = 0
+        pass
+    def policy(self, servername: str, capability: Capability) -> CachePolicy | None:
+        for name in (f'{servername}.{capability.name}', f'{servername}.*'):
+            if name in self.policies:
+                policy = self.policies[name]
+                if isinstance(policy, CachePolicy):
+                    return policy if policy.ttl or policy.dedupe else None
+                return CachePolicy(policy, True) if policy else None
+        if not self.use_annotations or not isinstance(capability, Tool) or capability.annotations is None:
+            return None
+        if capability.read_only:
+            return CachePolicy(self.default_ttl, True)
+        if capability.annotations.idempotentHint is True:
+            return CachePolicy(None, True)
+        return None
+    @staticmethod
+    def key(servername: str, capname: str, kwargs: dict) -> tuple:
+        return (servername, capname, json.dumps(kwargs, sort_keys=True, separators=(',', ':'), default=repr))
+    async def call(self, policy: CachePolicy, servername: str, capname: str, kwargs: dict, operation) -> tuple[object, str]:
+        key = ResultCache.key(servername, capname, kwargs)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1]), 'hit'
+            del self.entries[key]
+        if not policy.dedupe:
+            self.misses += 1
+            result = await operation(**kwargs)
+            self._store(policy, key, result)
+            return result, 'miss'
+        while key in self.inflight:
+            shared = self.inflight[key]
+            try:
+                result = await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                continue # the caller we were sharing with was cancelled, go again
+            self.shared += 1
+            return copy.deepcopy(result), 'shared'
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            result = await operation(**kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # waiters get it, nobody else needs to retrieve it
+            raise
+        finally:
+            del self.inflight[key]
+        future.set_result(result)
+        self._store(policy, key, result)
+        return result, 'miss'
+    def _store(self, policy: CachePolicy, key: tuple, result: object) -> None:
+        if policy.ttl:
+            self.entries[key] = (time.monotonic() + policy.ttl, copy.deepcopy(result))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return
+    def invalidate(self, servername: str | None = None) -> None:
+        for key in [key for key in self.entries if servername is None or key[0] == servername]:
+            del self.entries[key]
+        return
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'inflight': len(self.inflight), 'hits': self.hits, 'shared': self.shared, 'misses': self.misses, 'evictions': self.evictions}
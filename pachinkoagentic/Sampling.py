@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+The sampling layer behind MCP.Sample.  Responses are cached across workflows in a ResultCache keyed on the
+  system prompt and the question, identical prompts in flight at the same time share one request, each
+  workflow can be capped to a number of concurrent samples and, when the backend supports it, samples
+  queued within a few milliseconds of each other go out as one AIWrapper.get_batch_responses call.
+"""
+
+from .Logging import get_async_logger
+logger = get_async_logger(__name__, 'INFO')
+
+import asyncio
+from .AIWrapper import AIWrapper, AIResponse
+from .ResultCache import ResultCache, CachePolicy
+
+SAMPLE_SYSTEM_PROMPT = '''Respond to this question in HTML format.  Wrap the HTML in tags so that the final response looks like this:
+        [STARTANSWER]
+        <HTML formatted answer to the question goes here>
+        [ENDANSWER]
+
+        The HTML provided between the STARTANSWER and ENDANSWER tags will be inserted into an existing <DIV> block.
+        '''
+
+class UntaggedSample(Exception):
+    """Raised inside the cached request so that a reply without the answer tags is returned but never cached."""
+    def __init__(self, response: AIResponse):
+        super().__init__('Sample response has no [STARTANSWER] tag')
+        self.response = response
+
+class Sampler:
+    def __init__(self, llm: AIWrapper, cache: ResultCache | None = None, ttl: float | None = None, max_concurrency: int | None = None,
+                 batch_size: int = 16, batch_delay: float = 0.005):
+        self.llm = llm
+        self.cache = cache
+        self.policy = CachePolicy(ttl if ttl is not None else cache.default_ttl, True) if cache is not None else None
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency is not None else None
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue = []
+        self.flusher = None
+        self.requests = 0
+        self.batches = 0
+        pass
+    async def sample(self, system_prompt: str, question: str) -> tuple[AIResponse, str | None]:
+        if self.cache is None:
+            return await self._request(system_prompt=system_prompt, question=question), None
+        try:
+            return await self.cache.call(self.policy, 'MCP', 'Sample', {'system_prompt': system_prompt, 'question': question}, self._tagged_request)
+        except UntaggedSample as e:
+            return e.response, 'miss'
+    async def _tagged_request(self, system_prompt: str, question: str) -> AIResponse:
+        response = await self._request(system_prompt, question)
+        if '[STARTANSWER]' not in response.answer:
+            raise UntaggedSample(response)
+        return response
+    async def _request(self, system_prompt: str, question: str) -> AIResponse:
+        if self.semaphore is None:
+            return await self._send(system_prompt, question)
+        async with self.semaphore:
+            return await self._send(system_prompt, question)
+    async def _send(self, system_prompt: str, question: str) -> AIResponse:
+        self.requests += 1
+        if not self.llm.supports_batch:
+            return await self.llm.get_response(system_prompt=system_prompt, question=question, include_thinking=True)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.append(((system_prompt, question), future))
+        if len(self.queue) >= self.batch_size:
+            self._flush()
+        elif self.flusher is None:
+            self.flusher = loop.call_later(self.batch_delay, self._flush)
+        return await future
+    def _flush(self) -> None:
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        # waiters cancelled while queued are not sent
+        batch, self.queue = [item for item in self.queue if not item[1].done()], []
+        if len(batch) > 0:
+            self.batches += 1
+            asyncio.ensure_future(self._send_batch(batch))
+        return
+    async def _send_batch(self, batch: list) -> None:
+        try:
+            responses = await self.llm.get_batch_responses([request for request, _ in batch], include_thinking=True)
+            if len(responses) != len(batch):
+                raise ValueError(f'{len(responses)} responses were returned for a batch of {len(batch)} samples')
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            await logger.warning(f'Batch of {len(batch)} samples failed => {type(e)}:{e}')
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        return
+    def stats(self) -> dict:
+        return {'requests': self.requests, 'batches': self.batches}
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Circuit breaker kept by the Library for every MCP server.  A server is 'healthy' until it fails
+  failure_threshold catalog loads in a row, then it is 'open' and skipped without being contacted until
+  the reset timeout passes.  The next refresh is a single 'probing' attempt: success closes the breaker,
+  failure opens it again for twice as long, up to max_reset_timeout.
+"""
+
+import time
+
+class ServerHealth:
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0, max_reset_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = 'healthy'
+        self.failures = 0
+        self.last_error = None
+        self.last_success = None
+        self.retry_at = 0.0
+        self._backoff = reset_timeout
+        pass
+    def allow(self) -> bool:
+        if self.state == 'open':
+            if time.monotonic() < self.retry_at:
+                return False
+            self.state = 'probing'
+        return True
+    def success(self) -> None:
+        self.state = 'healthy'
+        self.failures = 0
+        self.last_success = time.time()
+        self._backoff = self.reset_timeout
+        return
+    def failure(self, error: str) -> bool:
+        """Records a failed load, returns True when this failure took a healthy server out of service."""
+        self.failures += 1
+        self.last_error = error
+        if self.state == 'probing':
+            self._backoff = min(self._backoff * 2, self.max_reset_timeout)
+        elif self.failures < self.failure_threshold:
+            return False
+        opened = self.state == 'healthy'
+        self.state = 'open'
+        self.retry_at = time.monotonic() + self._backoff
+        return opened
+    def snapshot(self) -> dict:
+        return {'state': self.state, 'failures': self.failures, 'last_error': self.last_error, 'last_success': self.last_success,
+                'retry_in': max(self.retry_at - time.monotonic(), 0.0) if self.state == 'open' else 0.0}
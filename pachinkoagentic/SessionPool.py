@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Keeps MCP Client sessions connected for the life of the Library so that each call made by an
+  agentic workflow does not pay for a full MCP initialize handshake.  Calls are multiplexed over the
+  single session per server and capped by a per server semaphore.  When a session drops during a call the
+  request may already have reached the server, so the call is only sent again on a new session when the
+  capability is replayable (read only or idempotent), otherwise the error is raised to the workflow.
+"""
+
+from .Logging import get_async_logger
+logger = get_async_logger(__name__, 'INFO')
+
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager
+from fastmcp import Client
+
+# seconds the current task last spent waiting for a per server slot, read back by the profiler
+queue_time = contextvars.ContextVar('queue_time', default=0.0)
+
+class MCPSession:
+    def __init__(self, mcp_server: Client, max_inflight: int, idle_timeout: float|None, connect_timeout: float|None = None):
+        self.mcp_server = mcp_server
+        self.max_inflight = max_inflight
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.semaphore = asyncio.Semaphore(max_inflight)
+        self.lock = asyncio.Lock()
+        self.connected = False
+        self.inflight = 0
+        self.last_used = time.monotonic()
+        self.reaper = None
+        pass
+    async def connect(self) -> Client:
+        async with self.lock:
+            if self.connected and not self.mcp_server.is_connected():
+                await logger.warning(f'MCP Server({self.mcp_server.transport}) dropped its session, reconnecting.')
+                await self._close()
+            if not self.connected:
+                try:
+                    await asyncio.wait_for(self.mcp_server.__aenter__(), self.connect_timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f'MCP Server({self.mcp_server.transport}) did not connect within {self.connect_timeout} seconds') from None
+                self.connected = True
+                if self.idle_timeout is not None and self.reaper is None:
+                    self.reaper = asyncio.ensure_future(self._reap())
+        return self.mcp_server
+    async def disconnect(self) -> None:
+        async with self.lock:
+            await self._close()
+        if self.reaper is not None and self.reaper is not asyncio.current_task():
+            self.reaper.cancel()
+        self.reaper = None
+        return
+    async def _close(self) -> None:
+        if self.connected:
+            self.connected = False
+            try:
+                await self.mcp_server.__aexit__(None, None, None)
+            except Exception as e:
+                await logger.warning(f'Error closing MCP Server({self.mcp_server.transport}) => {type(e)}:{e}')
+        return
+    async def _reap(self) -> None:
+        while self.connected:
+            await asyncio.sleep(max(self.idle_timeout - (time.monotonic() - self.last_used), 0.01))
+            if self.inflight == 0 and time.monotonic() - self.last_used >= self.idle_timeout:
+                await logger.debug(f'Closing idle MCP Server({self.mcp_server.transport})')
+                self.reaper = None
+                await self.disconnect()
+                return
+        return
+    async def run(self, operation, *args, replayable: bool = False, **kwargs) -> object:
+        queued = time.monotonic()
+        async with self.semaphore:
+            queue_time.set(time.monotonic() - queued)
+            self.inflight += 1
+            try:
+                await self.connect()
+                try:
+                    return await operation(*args, **kwargs)
+                except Exception:
+                    if self.mcp_server.is_connected():
+                        raise
+                    if not replayable:
+                        await logger.warning(f'MCP Server({self.mcp_server.transport}) dropped its session during a call, it is not sent again as the server may already have received it.')
+                        raise
+                    # The session died underneath us, reconnect and retry once.
+                    await self.connect()
+                    return await operation(*args, **kwargs)
+            finally:
+                self.inflight -= 1
+                self.last_used = time.monotonic()
+
+class MCPSessionPool:
+    def __init__(self, max_inflight: int = 16, idle_timeout: float|None = None, connect_timeout: float|None = None):
+        self.max_inflight = max_inflight
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.sessions = {}
+        pass
+    def session_for(self, mcp_server: Client) -> MCPSession:
+        session = self.sessions.get(id(mcp_server))
+        if session is None:
+            session = MCPSession(mcp_server, self.max_inflight, self.idle_timeout, self.connect_timeout)
+            self.sessions[id(mcp_server)] = session
+        return session
+    def set_limit(self, mcp_server: Client, max_inflight: int) -> None:
+        session = self.session_for(mcp_server)
+        if session.max_inflight != max_inflight:
+            # calls already holding the old semaphore release into it, new calls queue on the new limit
+            session.max_inflight = max_inflight
+            session.semaphore = asyncio.Semaphore(max_inflight)
+        return
+    @asynccontextmanager
+    async def session(self, mcp_server: Client):
+        session = self.session_for(mcp_server)
+        queued = time.monotonic()
+        async with session.semaphore:
+            queue_time.set(time.monotonic() - queued)
+            session.inflight += 1
+            try:
+                yield await session.connect()
+            finally:
+                session.inflight -= 1
+                session.last_used = time.monotonic()
+    async def call_tool(self, mcp_server: Client, name: str, arguments: dict, replayable: bool = False) -> object:
+        return await self.session_for(mcp_server).run(mcp_server.call_tool, name, arguments, replayable=replayable)
+    async def read_resource(self, mcp_server: Client, uri: str, replayable: bool = True) -> object:
+        return await self.session_for(mcp_server).run(mcp_server.read_resource, uri, replayable=replayable)
+    async def get_prompt(self, mcp_server: Client, name: str, arguments: dict, replayable: bool = True) -> object:
+        return await self.session_for(mcp_server).run(mcp_server.get_prompt, name, arguments, replayable=replayable)
+    async def close(self) -> None:
+        await asyncio.gather(*[session.disconnect() for session in self.sessions.values()])
+        return
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Static checks of a generated agentic function before it is executed.  The AST is rejected for imports, calls to
+  exec/eval and the other builtins that reach outside the sandbox, dunder access, statements outside the
+  function, MCP modules or functions that are not in the catalog and tool calls whose keyword arguments do
+  not match the tool's input schema.  Private attributes and the introspection attributes of tasks,
+  coroutines, generators, frames, tracebacks and code objects (get_coro, cr_frame, f_globals, tb_frame,
+  co_code, ...) are rejected on any object, as is str.format, whose fields can walk attributes where the
+  AST cannot see them.  The package object itself may only appear as the base of
+  MCP.<builtin> or a called MCP.<module>.<function>(...), so an alias cannot reach the wrapper's internals
+  or skip the checks.
+
+Results are cached on the hash of the code (under the canonical function name, so a cached plan re-run by
+  another workflow is a hit) and the catalog version.  Failures are structured so that they can be sent
+  back to the code generator as a short repair prompt rather than a full regeneration.
+"""
+
+import ast
+import collections
+import hashlib
+from dataclasses import dataclass, field
+from .Capabilities import Tool
+from .MCPWrapper import MCPWrapper
+
+@dataclass
+class ValidationError:
+    lineno: int
+    kind: str
+    message: str
+
+@dataclass
+class ValidationResult:
+    valid: bool
+    errors: list = field(default_factory=list)
+    def __str__(self) -> str:
+        return '\n'.join(f'Line {error.lineno}: {error.message}' for error in self.errors)
+    def repair_prompt(self, code: str) -> str:
+        return f'''This function failed validation and cannot be run:
+{code}
+
+These are the problems that were found:
+{self}
+
+Correct only these problems and return the whole corrected function wrapped in the same [PYTHON BEGINS] and [PYTHON ENDS] tags.
+'''
+
+class Validator:
+    forbidden_names = frozenset(['exec', 'eval', 'compile', '__import__', 'globals', 'locals', 'vars', 'getattr', 'setattr', 'delattr',
+                                 'open', 'input', 'breakpoint', 'exit', 'quit'])
+    forbidden_attribute_prefixes = ('_', 'cr_', 'gi_', 'ag_', 'f_', 'tb_', 'co_', 'func_')
+    forbidden_attributes = frozenset(['get_coro', 'get_stack', 'print_stack', 'get_loop', 'format', 'format_map', 'mro'])
+    def __init__(self, package: str = 'MCP', max_entries: int = 1024):
+        self.package = package
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        pass
+    def validate(self, code: str, funcname: str, catalog: dict, catalog_version: int) -> ValidationResult:
+        canonical = code.replace(funcname, MCPWrapper.canonical_funcname)
+        key = (hashlib.sha256(canonical.encode()).hexdigest(), catalog_version)
+        result = self.entries.get(key)
+        if result is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return result
+        self.misses += 1
+        errors = self.check(canonical, MCPWrapper.canonical_funcname, catalog)
+        result = ValidationResult(len(errors) == 0, errors)
+        self.entries[key] = result
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return result
+    def check(self, code: str, funcname: str, catalog: dict) -> list:
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return [ValidationError(e.lineno or 0, 'syntax', f'Syntax error: {e.msg}')]
+        errors = []
+        defined = False
+        for node in tree.body:
+            if isinstance(node, ast.AsyncFunctionDef) and node.name == funcname:
+                defined = True
+            elif not isinstance(node, (ast.Import, ast.ImportFrom)) and not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)):
+                errors.append(ValidationError(node.lineno, 'statement', f'Only the function may be defined, this {type(node).__name__} is outside of it.'))
+        if not defined:
+            errors.append(ValidationError(1, 'missing_function', f'async def {funcname}({self.package}: object) is not defined.'))
+        parents = {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                errors.append(ValidationError(node.lineno, 'import', 'Imports are not allowed, every function is in the parameter object.'))
+            elif isinstance(node, ast.Name) and (node.id in Validator.forbidden_names or node.id.startswith('__')):
+                errors.append(ValidationError(node.lineno, 'forbidden', f'{node.id} may not be used.'))
+            elif isinstance(node, ast.Attribute) and node.attr.startswith('__'):
+                errors.append(ValidationError(node.lineno, 'dunder', f'Attribute {node.attr} may not be accessed.'))
+            elif isinstance(node, ast.Attribute) and not self._names_mcp(node) and (node.attr in Validator.forbidden_attributes or node.attr.startswith(Validator.forbidden_attribute_prefixes)):
+                errors.append(ValidationError(node.lineno, 'introspection', f'Attribute {node.attr} may not be accessed.'))
+            elif isinstance(node, ast.Name) and node.id == self.package:
+                errors += self._check_reference(node, parents, catalog)
+            elif isinstance(node, ast.Call):
+                errors += self._check_arguments(node, catalog)
+        return sorted(errors, key=lambda error: error.lineno)
+    def _names_mcp(self, node: ast.Attribute) -> bool:
+        # MCP.<name> and MCP.<module>.<name> are checked against the catalog instead, tools may have any name
+        base = node.value.value if isinstance(node.value, ast.Attribute) else node.value
+        return isinstance(base, ast.Name) and base.id == self.package
+    def _check_reference(self, node: ast.Name, parents: dict, catalog: dict) -> list:
+        attribute = parents.get(node)
+        if not isinstance(node.ctx, ast.Load) or not isinstance(attribute, ast.Attribute):
+            return [ValidationError(node.lineno, 'alias', f'{self.package} may only be used as {self.package}.<function>(...) or {self.package}.<module>.<function>(...).')]
+        if attribute.attr in MCPWrapper.builtin_function_names:
+            return []
+        if attribute.attr not in catalog:
+            return [ValidationError(node.lineno, 'unknown_module', f'{self.package}.{attribute.attr} is neither a module nor a built in function.')]
+        function = parents.get(attribute)
+        if not isinstance(function, ast.Attribute):
+            return [ValidationError(node.lineno, 'alias', f'Module {attribute.attr} may only be used to call one of its functions.')]
+        if function.attr not in catalog[attribute.attr]:
+            return [ValidationError(node.lineno, 'unknown_function', f'Module {attribute.attr} has no function {function.attr}.')]
+        call = parents.get(function)
+        if not isinstance(call, ast.Call) or call.func is not function:
+            return [ValidationError(node.lineno, 'alias', f'{attribute.attr}.{function.attr} must be called where it is named so its arguments can be checked.')]
+        return []
+    def _check_arguments(self, call: ast.Call, catalog: dict) -> list:
+        func = call.func
+        if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Attribute) and isinstance(func.value.value, ast.Name) and func.value.value.id == self.package):
+            return []
+        capability = catalog.get(func.value.attr, {}).get(func.attr)
+        if not isinstance(capability, Tool):
+            return []
+        name = f'{func.value.attr}.{func.attr}'
+        errors = []
+        if len(call.args) > 0:
+            errors.append(ValidationError(call.lineno, 'positional_argument', f'{name} only takes keyword arguments.'))
+        if any(keyword.arg is None for keyword in call.keywords):
+            return errors # **kwargs, the names are not known until it runs
+        parameters = capability.input_schema or {}
+        passed = {keyword.arg for keyword in call.keywords}
+        for argument in sorted(passed - set(parameters)):
+            errors.append(ValidationError(call.lineno, 'unexpected_argument', f'{name} has no parameter {argument}, its parameters are {list(parameters)}.'))
+        for argument in capability.required:
+            if argument not in passed:
+                errors.append(ValidationError(call.lineno, 'missing_argument', f'{name} requires parameter {argument}.'))
+        return errors
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
@@ -8,25 +8,70 @@ Uses the LM to generate a python function using MCP server routines.  Executes b
 Also creates an AsyncDeque that agentic steps emit (async generator) events to while acting as coroutines for
   results within the agentic workflow function.
 
-Function is loaded as a module and unloaded on completion in order to restrain growth of the memory space.
+With candidates > 1 the plan is generated speculatively: that many requests go out at once, round robin over
+  candidate_generators (for example the same model served at different temperatures), and the first answer
+  that has the tags and passes the Library's Validator wins while the rest are cancelled.
+
+Generated code that fails validation is sent back to the generator with the errors and only the modules it
+  uses for up to repair_attempts quick repairs before generation is given up as failed.
+
+Function is compiled once per unique plan and executed in a throwaway namespace that is cleared on completion
+  in order to restrain growth of the memory space, or optionally in a ProcessPool worker so that CPU heavy
+  plans do not block the event loop.
 """
 
 from .Logging import get_async_logger
 logger = get_async_logger(__name__, 'INFO')   
 
+import ast
 import time
 import asyncio
-from .AIWrapper import AIWrapper
+import contextlib
+from .AIWrapper import AIWrapper, AIResponse
 from .Library import Library
-from .WorkflowEvent import WorkflowEventType, WorkflowEvent
+from .PlanCache import PlanCache
+from .ProcessPool import ProcessPool
+from .Parallelizer import Parallelizer
+from .ResultCache import ResultCache
+from .Sampling import Sampler
+from .WorkflowEvent import WorkflowEventType, WorkflowEvent, WorkflowEventBroadcast, WorkflowEventSubscription
 from .Flowchart import Flowchart, End, Call, Junction
+from .Validator import ValidationResult, ValidationError
 
 class Workflow:
-    def __init__(self, agentic_code_generator: AIWrapper, llm: AIWrapper, library: Library, workflow_id: str):
+    def __init__(self, agentic_code_generator: AIWrapper, llm: AIWrapper, library: Library, workflow_id: str, relevance_top_k: int|None = None, plan_cache: PlanCache|None = None, streaming: bool = False, event_queue_size: int = 0, coalesce_updates: bool = False, replay_capacity: int = 1024, process_pool: ProcessPool|None = None, parallelize: bool = False, node_updates: bool = False, verbose_updates: bool = True, profile: bool = False, sample_cache: ResultCache|None = None, sample_concurrency: int|None = None, deadline: float|None = None, candidates: int = 1, candidate_generators: list[AIWrapper]|None = None, repair_attempts: int = 1):
         self.agentic_code_generator = agentic_code_generator
         self.llm = llm
         self.library = library
         self.workflow_id = workflow_id
+        self.relevance_top_k = relevance_top_k
+        self.plan_cache = plan_cache
+        self.streaming = streaming
+        self.event_queue_size = event_queue_size
+        self.coalesce_updates = coalesce_updates
+        self.process_pool = process_pool
+        self.parallelize = parallelize
+        self.node_updates = node_updates
+        self.verbose_updates = verbose_updates
+        self.profile = profile
+        self.sample_cache = sample_cache
+        self.sample_concurrency = sample_concurrency
+        self.deadline = deadline
+        self.candidates = candidates
+        self.candidate_generators = candidate_generators or [agentic_code_generator]
+        self.speculation_stats = None
+        self.repair_attempts = repair_attempts
+        self.validation = None
+        self.repairs = 0
+        self.execution = None
+        self.cancelled = False
+        self.profiler = None
+        self.workplan = None
+        self.parallel_stats = None
+        self.event_stats = None
+        self.events = WorkflowEventBroadcast(replay_capacity)
+        self.flowchart = None
+        self.prompt_stats = None
         self._funcname = f'PACHINKO_AGENTIC_WORKFLOW_{self.workflow_id}'
         self._generator_prompt = f'''First, you are to define a Python function using this name and accepting one parameter named {self.library.package}:  async def {self._funcname}({self.library.package}: object)
         You shall construct this function using the available library of functions to answer the user's question.
@@ -48,55 +93,294 @@ class Workflow:
         '''
         return
     
+    def subscribe(self, from_seq: int | None = None) -> WorkflowEventSubscription:
+        return self.events.subscribe(from_seq)
+
     async def generate(self, question: str):
+        self.events.reopen()
+        async for event in self.__generate(question):
+            self.events.publish(event)
+            yield event
+
+    async def __generate(self, question: str):
         yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_GENERATION_START, workflow_id=self.workflow_id, extra_data=None)
         global __generator_prompt
         start = time.time()
-        await self.library.reload()
-        await logger.debug(self.library.swagger_docs())
+        await self.library.refresh()
+        plan_key = None
+        if self.plan_cache is not None:
+            plan_key = PlanCache.key(question, self.library.catalog_hash())
+            plan = await self.plan_cache.get(plan_key)
+            await logger.info(f'Plan cache {"hit" if plan is not None else "miss"}: {self.plan_cache.stats()}')
+            if plan is not None:
+                self.workplan = None
+                self.code = plan[0].replace(PlanCache.funcname_placeholder, self._funcname)
+                self.image = plan[1]
+                # the cached SVG is reused, the model is rebuilt for the pending nodes and the heatmap
+                self.flowchart = Flowchart(self.library.package)
+                await self.flowchart.from_code(self.workflow_id, self.code)
+                yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_CODE, workflow_id=self.workflow_id, extra_data=self.code)
+                yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_IMAGE, workflow_id=self.workflow_id, extra_data=self.image)
+                yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_GENERATION_END, workflow_id=self.workflow_id, extra_data=f'Agentic Flow Generation took {time.time() - start:.2f} seconds (plan cache).')
+                return
+        swagger_docs = self.library.swagger_docs()
+        capability_count = sum(len(self.library.capabilities[lib]['capabilities']) for lib in self.library.capabilities)
+        self.prompt_stats = {'full_library_chars': len(swagger_docs), 'total_capabilities': capability_count, 'unavailable_servers': self.library.unavailable()}
+        if self.relevance_top_k is not None:
+            swagger_docs, capability_count = self.library.relevant_docs(question, self.relevance_top_k)
+        await logger.debug(swagger_docs)
         self.code = ''
         self.image = ''
-        system_prompt = self._generator_prompt+self.library.swagger_docs()
+        system_prompt = self._generator_prompt+swagger_docs
+        self.prompt_stats.update({'library_chars': len(swagger_docs), 'prompt_chars': len(system_prompt), 'capabilities': capability_count})
+        await logger.info(f'Generator prompt is {len(system_prompt)} characters with {capability_count} of {self.prompt_stats["total_capabilities"]} capabilities ({len(swagger_docs)} of {self.prompt_stats["full_library_chars"]} library characters).')
         await logger.debug(system_prompt)
         yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_GENERATION_PROMPT, workflow_id=self.workflow_id, extra_data=system_prompt)
-        llm_response = await self.agentic_code_generator.get_response(system_prompt=system_prompt,
-                                                         question=question,
-                                                         include_thinking=True)
-        self.workplan = llm_response
-        await logger.debug(self.workplan)
+        if self.streaming:
+            self.workplan = None
+        elif self.candidates <= 1:
+            self.workplan = await self.agentic_code_generator.get_response(system_prompt=system_prompt,
+                                                             question=question,
+                                                             include_thinking=True)
+            await logger.debug(self.workplan)
         try:
-            code = self.workplan.answer.split('[PYTHON BEGINS]')[1]
-            if code is not None:
-                self.code = code.split('[PYTHON ENDS]')[0].strip()
-            await logger.debug(self.code)
-            flowchart = Flowchart()
-            await logger.debug('Building flowchart')
-            await flowchart.from_code(self.workflow_id, self.code)
-            self.image = await flowchart.svg()
+            if self.streaming:
+                async for event in self.__stream_plan(system_prompt, question):
+                    yield event
+            else:
+                if self.candidates > 1:
+                    self.workplan, self.code = await self.__speculate(system_prompt, question)
+                else:
+                    code = self.workplan.answer.split('[PYTHON BEGINS]')[1]
+                    if code is not None:
+                        self.code = code.split('[PYTHON ENDS]')[0].strip()
+                await logger.debug(self.code)
+                await self.__validate(question)
+                self.flowchart = Flowchart(self.library.package)
+                await logger.debug('Building flowchart')
+                await self.flowchart.from_code(self.workflow_id, self.code)
+            if self.streaming:
+                code = self.code
+                await self.__validate(question)
+                if self.code != code:
+                    self.flowchart = Flowchart(self.library.package)
+                    await self.flowchart.from_code(self.workflow_id, self.code)
+            if self.parallelize:
+                await self.__parallelize()
+            self.image = await self.flowchart.svg()
+            if plan_key is not None:
+                await self.plan_cache.put(plan_key, self.code.replace(self._funcname, PlanCache.funcname_placeholder), self.image)
             yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_CODE, workflow_id=self.workflow_id, extra_data=self.code)
             yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_IMAGE, workflow_id=self.workflow_id, extra_data=self.image)
         except Exception as e:
             self.code = None
-            await logger.error(f'Failed to create workflow: {type(e)}: {e}.  LLM returned: {llm_response}')
-            yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_GENERATION_FAILED, workflow_id=self.workflow_id, extra_data=f'Failed to create workflow: {type(e)}: {e}.  LLM returned: {llm_response}')
+            await logger.error(f'Failed to create workflow: {type(e)}: {e}.  LLM returned: {self.workplan}')
+            yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_GENERATION_FAILED, workflow_id=self.workflow_id, extra_data=f'Failed to create workflow: {type(e)}: {e}.  LLM returned: {self.workplan}')
         finally:
             yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_GENERATION_END, workflow_id=self.workflow_id, extra_data=f'Agentic Flow Generation took {time.time() - start:.2f} seconds.')
         
+    async def __speculate(self, system_prompt: str, question: str) -> tuple[AIResponse, str]:
+        start = time.time()
+        candidates = {}
+        for i in range(self.candidates):
+            generator = self.candidate_generators[i % len(self.candidate_generators)]
+            candidates[asyncio.ensure_future(generator.get_response(system_prompt=system_prompt, question=question, include_thinking=True))] = i
+        self.speculation_stats = {'candidates': self.candidates, 'winner': None, 'generator': None, 'rejected': [], 'cancelled': 0, 'duration': None}
+        pending = set(candidates)
+        try:
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=candidates.get):
+                    try:
+                        workplan = task.result()
+                        code = self.__candidate_code(workplan.answer)
+                    except Exception as e:
+                        await logger.info(f'Candidate {candidates[task]} rejected => {type(e)}: {e}')
+                        self.speculation_stats['rejected'].append({'candidate': candidates[task], 'generator': candidates[task] % len(self.candidate_generators), 'error': f'{type(e).__name__}: {e}'})
+                        continue
+                    self.speculation_stats.update(winner=candidates[task], generator=candidates[task] % len(self.candidate_generators), cancelled=len(pending), duration=time.time()-start)
+                    await logger.info(f'Candidate {candidates[task]} of {self.candidates} won after {time.time()-start:.2f} seconds, {len(self.speculation_stats["rejected"])} rejected.')
+                    return workplan, code
+        finally:
+            for task in pending:
+                task.cancel()
+        self.speculation_stats['duration'] = time.time()-start
+        raise ValueError(f'None of the {self.candidates} candidates was valid: {self.speculation_stats["rejected"]}')
+
+    @staticmethod
+    def __tagged_code(answer: str) -> str | None:
+        if '[PYTHON BEGINS]' not in answer:
+            return None
+        return answer.split('[PYTHON BEGINS]')[1].split('[PYTHON ENDS]')[0].strip()
+
+    def __candidate_code(self, answer: str) -> str:
+        code = Workflow.__tagged_code(answer)
+        if code is None:
+            raise ValueError('No [PYTHON BEGINS] tag in the response.')
+        validation = self.library.validate(code, self._funcname)
+        if not validation.valid:
+            raise ValueError(f'Failed validation:\n{validation}')
+        return code
+
+    async def __validate(self, question: str) -> None:
+        # every generation gets its full repair attempts, also when the workflow is reused
+        self.repairs = 0
+        self.validation = self.library.validate(self.code, self._funcname)
+        while not self.validation.valid and self.repairs < self.repair_attempts:
+            self.repairs += 1
+            await logger.info(f'Generated code failed validation, repair attempt {self.repairs} =>\n{self.validation}')
+            # only the modules the plan already uses, anything it got wrong is named in the errors
+            try:
+                modules = {node.value.attr for node in ast.walk(ast.parse(self.code)) if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Attribute)
+                           and isinstance(node.value.value, ast.Name) and node.value.value.id == self.library.package}
+            except SyntaxError:
+                modules = set()
+            if any(error.kind == 'unknown_module' for error in self.validation.errors) or len(modules) == 0:
+                docs = self.library.swagger_docs()
+            else:
+                docs = self.library.docs_for(modules)
+            repair = await self.agentic_code_generator.get_response(system_prompt=self._generator_prompt+docs,
+                                                                    question=f'{question}\n\n{self.validation.repair_prompt(self.code)}',
+                                                                    include_thinking=True)
+            code = Workflow.__tagged_code(repair.answer)
+            if code is None:
+                # the previous code is kept so the next attempt can still be shown what to fix
+                self.validation = ValidationResult(False, [ValidationError(0, 'tags', 'The reply had no [PYTHON BEGINS] tag, wrap the corrected function in [PYTHON BEGINS] and [PYTHON ENDS].')]
+                                                   + [error for error in self.validation.errors if error.kind != 'tags'])
+                continue
+            self.code = code
+            self.validation = self.library.validate(self.code, self._funcname)
+        if not self.validation.valid:
+            raise ValueError(f'Generated code failed validation:\n{self.validation}')
+        return
+
+    async def __parallelize(self) -> None:
+        plan = Parallelizer(self.library.package, self.library.is_read_only).rewrite(self.code)
+        self.parallel_stats = {'batches': plan.batches, 'calls_batched': plan.calls_batched,
+                               'critical_path_before': plan.critical_path_before, 'critical_path_after': plan.critical_path_after}
+        await logger.info(f'Parallelized {plan.calls_batched} calls into {plan.batches} batches, critical path {plan.critical_path_before} => {plan.critical_path_after} awaits.')
+        if plan.batches > 0:
+            self.code = plan.code
+            self.flowchart = Flowchart(self.library.package)
+            await self.flowchart.from_code(self.workflow_id, self.code)
+        return
+
+    async def __stream_plan(self, system_prompt: str, question: str):
+        start = time.time()
+        answer = ''
+        code_start = None
+        completed_lines = 0
+        symbols = 0
+        self.flowchart = Flowchart(self.library.package)
+        stream = self.agentic_code_generator.get_streaming_response(system_prompt=system_prompt,
+                                                                    question=question,
+                                                                    include_thinking=True)
+        try:
+            async for chunk in stream:
+                answer += chunk
+                if code_start is None:
+                    begins = answer.find('[PYTHON BEGINS]')
+                    if begins < 0:
+                        continue
+                    code_start = begins + len('[PYTHON BEGINS]')
+                ends = answer.find('[PYTHON ENDS]', code_start)
+                code = answer[code_start:ends] if ends >= 0 else answer[code_start:]
+                lines = code.lstrip().split('\n')
+                if ends < 0:
+                    lines = lines[:-1] # last line is still being written
+                if len(lines) > completed_lines:
+                    for lineno in range(max(completed_lines, 1), len(lines)): # skipping first line which is function declaration
+                        await self.flowchart.add_line(lineno+1, lines[lineno])
+                    completed_lines = len(lines)
+                    if ends < 0:
+                        yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_CODE, workflow_id=self.workflow_id, extra_data='\n'.join(lines))
+                        if sum(len(row) for row in self.flowchart.rows) > symbols:
+                            symbols = sum(len(row) for row in self.flowchart.rows)
+                            yield WorkflowEvent(event_type=WorkflowEventType.WORKFLOW_IMAGE, workflow_id=self.workflow_id, extra_data=await self.flowchart.snapshot().svg())
+                if ends >= 0:
+                    await logger.debug('[PYTHON ENDS] seen, not waiting for the rest of the response.')
+                    self.code = code.strip()
+                    break
+        finally:
+            if hasattr(stream, 'aclose'):
+                await stream.aclose()
+            self.workplan = AIResponse(answer=answer, thought='', prompt_token_use=0, completion_token_use=0, duration=time.time()-start)
+        if code_start is None:
+            raise ValueError('No [PYTHON BEGINS] tag in the streamed response.')
+        if ends < 0:
+            self.code = code.strip()
+            lines = self.code.split('\n')
+            for lineno in range(max(completed_lines, 1), len(lines)):
+                await self.flowchart.add_line(lineno+1, lines[lineno])
+        self.flowchart.finish()
+        await logger.debug(self.code)
+        return
+
     async def process(self):
+        async with contextlib.aclosing(self.process_batches(max_items=1, max_delay=0)) as batches:
+            async for batch in batches:
+                for event in batch:
+                    yield event
+
+    def cancel(self) -> bool:
+        if self.execution is None or self.execution.done():
+            return False
+        self.cancelled = self.execution.cancel()
+        return self.cancelled
+
+    async def process_batches(self, max_items: int = 64, max_delay: float = 0.05):
         start = time.time()
-        runner = self.library.mcp_wrapper(self.llm, self.workflow_id)
+        runner = self.library.mcp_wrapper(self.llm, self.workflow_id, event_queue_size=self.event_queue_size, coalesce_updates=self.coalesce_updates, process_pool=self.process_pool,
+                                          node_updates=self.node_updates, verbose_updates=self.verbose_updates, profile=self.profile,
+                                          sampler=Sampler(self.llm, self.sample_cache, max_concurrency=self.sample_concurrency))
+        self.profiler = runner.profiler
+        if self.profiler is not None and self.workplan is not None:
+            self.profiler.generation = {'prompt_tokens': self.workplan.prompt_token_use, 'completion_tokens': self.workplan.completion_token_use, 'duration': self.workplan.duration}
+        nodes = None
+        if self.flowchart is not None:
+            # loops and branches never report, so only symbols that send updates start out pending
+            nodes = sorted({symbol.lineno for row in self.flowchart.rows for symbol in row if isinstance(symbol, (Call, Junction))})
         await logger.debug('Starting agentic')
-        foo = asyncio.ensure_future(runner.exec_agentic_function(self._funcname, self.code))
+        foo = asyncio.ensure_future(runner.exec_agentic_function(self._funcname, self.code, nodes, self.deadline))
+        self.execution = foo
+        self.cancelled = False
+        ended = False
         await logger.debug('Starting message pump')
-        async for event in runner.event_stream:
-            await logger.debug(f'Got event: {event}')
-            yield event
-            if event.event_type == WorkflowEventType.WORKFLOW_END:
-                await logger.debug('Completion Event Detected, exiting loop')
-                break
+        try:
+            async for batch in runner.event_stream.batches(max_items, max_delay):
+                await logger.debug('Got events: %s', batch)
+                for event in batch:
+                    self.events.publish(event)
+                yield batch
+                if batch[-1].event_type == WorkflowEventType.WORKFLOW_END:
+                    await logger.debug('Completion Event Detected, exiting loop')
+                    ended = True
+                    break
+        finally:
+            if not ended and not foo.done():
+                # the consumer closed the generator, stop the plan and whatever it has in flight
+                await logger.info(f'Event consumer for {self.workflow_id} went away, cancelling the workflow.')
+                await runner.event_stream.stop()
+                foo.cancel()
+                await asyncio.gather(foo, return_exceptions=True)
+            # subscribers still get whatever was not batched yet, the cancellation and the end, then the broadcast ends
+            for event in await runner.event_stream.drain():
+                self.events.publish(event)
+            self.events.close()
+            self.event_stats = runner.event_stream.stats()
         await logger.debug('Exited message pump')
+        await logger.debug('Event stream stats: %s', self.event_stats)
         if foo is not None:
             await logger.debug('Final await on foo')
-            await foo
+            try:
+                await foo
+            except asyncio.CancelledError:
+                # cancel() already ended the stream with the cancellation, only a cancel of the consumer goes on
+                if not self.cancelled or asyncio.current_task().cancelling() > 0:
+                    raise
         await logger.debug('Process complete')
 
+    async def heatmap(self) -> str | None:
+        if self.flowchart is None or self.profiler is None:
+            return None
+        return await self.flowchart.svg(heatmap=self.profiler.heatmap())
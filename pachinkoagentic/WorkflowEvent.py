@@ -10,6 +10,7 @@ from enum import StrEnum, auto
 from dataclasses import dataclass
 import collections
 import asyncio
+import time
 
 class WorkflowEventType(StrEnum):
     WORKFLOW_GENERATION_START = auto()
@@ -23,6 +24,8 @@ class WorkflowEventType(StrEnum):
     WORKFLOW_UPDATE = auto()
     ANSWER_UPDATE = auto()
     COMPLETE = auto()
+    NODE_STATE = auto()
+    WORKFLOW_CANCELLED = auto()
 
 @dataclass
 class WorkflowEvent:
@@ -31,10 +34,16 @@ class WorkflowEvent:
     extra_data: Any
 
 class WorkflowEventStream(collections.deque):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, maxsize: int = 0, coalesce_updates: bool = False, **kwargs):
         super().__init__(*args, **kwargs)
-        self._not_empty = asyncio.Condition()  # For signaling when items are added
+        self._lock = asyncio.Lock()
+        self._not_empty = asyncio.Condition(self._lock)  # For signaling when items are added
+        self._not_full = asyncio.Condition(self._lock)  # For signaling producers when a bounded deque drains
         self._stopped = False  # To indicate when the deque is stopped
+        self.maxsize = maxsize  # 0 is unbounded
+        self.coalesce_updates = coalesce_updates  # replace a still queued WORKFLOW_UPDATE for the same line
+        self._queued_updates = {}
+        self.metrics = {'puts': 0, 'gets': 0, 'coalesced': 0, 'max_depth': 0, 'producer_waits': 0, 'producer_wait_time': 0.0, 'max_producer_wait_time': 0.0}
 
     def __aiter__(self):
         return self
@@ -45,19 +54,78 @@ class WorkflowEventStream(collections.deque):
                 await self._not_empty.wait()  # Wait until an item is added or stopped
             if self._stopped and not self:
                 raise StopAsyncIteration
-            return self.popleft()
+            return self._take(1)[0]
+
+    def _take(self, count: int) -> list:
+        items = []
+        while self and len(items) < count:
+            item = self.popleft()
+            if self._queued_updates.get(WorkflowEventStream._update_line(item)) is item:
+                del self._queued_updates[WorkflowEventStream._update_line(item)]
+            items.append(item)
+        self.metrics['gets'] += len(items)
+        self._not_full.notify(len(items))
+        return items
+
+    @staticmethod
+    def _update_line(item) -> int | None:
+        if isinstance(item, WorkflowEvent) and item.event_type == WorkflowEventType.WORKFLOW_UPDATE and isinstance(item.extra_data, dict):
+            return item.extra_data.get('line')
+        return None
 
     async def put(self, item):
-        """Add an item to the deque and notify waiting consumers."""
+        """Add an item to the deque and notify waiting consumers, waiting for room if the deque is bounded."""
         async with self._not_empty:
+            self.metrics['puts'] += 1
+            line = WorkflowEventStream._update_line(item) if self.coalesce_updates else None
+            if line is not None and line in self._queued_updates:
+                self._queued_updates[line].extra_data = item.extra_data
+                self.metrics['coalesced'] += 1
+                return
+            if self.maxsize > 0 and len(self) >= self.maxsize and not self._stopped:
+                start = time.perf_counter()
+                while len(self) >= self.maxsize and not self._stopped:
+                    await self._not_full.wait()
+                waited = time.perf_counter() - start
+                self.metrics['producer_waits'] += 1
+                self.metrics['producer_wait_time'] += waited
+                self.metrics['max_producer_wait_time'] = max(self.metrics['max_producer_wait_time'], waited)
             self.append(item)
+            if line is not None:
+                self._queued_updates[line] = item
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], len(self))
             self._not_empty.notify()
 
+    async def batches(self, max_items: int = 64, max_delay: float = 0.05):
+        """Yield lists of up to max_items events, waiting at most max_delay after the first event for the batch to fill."""
+        while True:
+            async with self._not_empty:
+                while not self and not self._stopped:
+                    await self._not_empty.wait()
+                if self._stopped and not self:
+                    return
+                if len(self) < max_items and max_delay > 0:
+                    try:
+                        await asyncio.wait_for(self._not_empty.wait_for(lambda: len(self) >= max_items or self._stopped), max_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                batch = self._take(max_items)
+            yield batch
+
+    async def drain(self) -> list:
+        """Take every event still queued without waiting, for a consumer that stopped iterating early."""
+        async with self._not_empty:
+            return self._take(len(self))
+
+    def stats(self) -> dict:
+        return dict(self.metrics, depth=len(self))
+
     async def stop(self):
         """Stop all waiting consumers by notifying them."""
         async with self._not_empty:
             self._stopped = True
             self._not_empty.notify_all()
+            self._not_full.notify_all()
 
     async def __aenter__(self):
         """Enter context, returning the deque."""
@@ -66,4 +134,64 @@ class WorkflowEventStream(collections.deque):
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Exit context, ensuring proper cleanup."""
         await self.stop()
-    
\ No newline at end of file
+
+class WorkflowEventBroadcast:
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._ring = [None] * capacity  # event with sequence number n lives at n % capacity
+        self._next_seq = 0
+        self._published = asyncio.Event()
+        self._closed = False
+
+    @property
+    def first_seq(self) -> int:
+        return max(0, self._next_seq - self.capacity)
+
+    @property
+    def next_seq(self) -> int:
+        return self._next_seq
+
+    def publish(self, event: WorkflowEvent) -> int:
+        """Append an event to the ring buffer and wake subscribers.  Never waits, slow subscribers lose the oldest events instead."""
+        seq = self._next_seq
+        self._ring[seq % self.capacity] = event
+        self._next_seq += 1
+        self._wake()
+        return seq
+
+    def close(self) -> None:
+        """Subscribers finish once they have caught up with the last published event."""
+        self._closed = True
+        self._wake()
+
+    def reopen(self) -> None:
+        self._closed = False
+
+    def _wake(self) -> None:
+        published, self._published = self._published, asyncio.Event()
+        published.set()
+
+    def subscribe(self, from_seq: int | None = None) -> 'WorkflowEventSubscription':
+        """Subscribe from a sequence number (replaying what is still buffered), or from the next event if None."""
+        return WorkflowEventSubscription(self, self._next_seq if from_seq is None else from_seq)
+
+class WorkflowEventSubscription:
+    def __init__(self, broadcast: WorkflowEventBroadcast, cursor: int):
+        self.broadcast = broadcast
+        self.cursor = cursor
+        self.dropped = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple[int, WorkflowEvent]:
+        while self.cursor >= self.broadcast._next_seq:
+            if self.broadcast._closed:
+                raise StopAsyncIteration
+            await self.broadcast._published.wait()
+        if self.cursor < self.broadcast.first_seq:
+            self.dropped += self.broadcast.first_seq - self.cursor
+            self.cursor = self.broadcast.first_seq
+        seq = self.cursor
+        self.cursor += 1
+        return seq, self.broadcast._ring[seq % self.broadcast.capacity]
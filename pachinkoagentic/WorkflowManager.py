@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Runs many Workflows against a shared Library with a global view.  Admission is limited to a number of
+  concurrently running workflows, excess work is queued by priority with fair share between tenants,
+  and LLM generation and LLM sampling are each behind their own token aware semaphore.
+"""
+
+from .Logging import get_async_logger
+logger = get_async_logger(__name__, 'INFO')
+
+import asyncio
+import collections
+import heapq
+import itertools
+import time
+import uuid
+from typing import Generator
+from .AIWrapper import AIWrapper, AIResponse
+from .Library import Library
+from .Workflow import Workflow
+from .Profiler import ProfileAggregator
+
+class TokenSemaphore:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.available = capacity
+        self.waiting = 0
+        self._condition = asyncio.Condition()
+        pass
+    async def acquire(self, tokens: int) -> int:
+        tokens = min(tokens, self.capacity)
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.available >= tokens)
+            finally:
+                self.waiting -= 1
+            self.available -= tokens
+        return tokens
+    async def release(self, tokens: int) -> None:
+        async with self._condition:
+            self.available += tokens
+            self._condition.notify_all()
+        return
+    def stats(self) -> dict:
+        return {'capacity': self.capacity, 'in_use': self.capacity - self.available, 'waiting': self.waiting}
+
+class LimitedAIWrapper(AIWrapper):
+    # roughly four characters per token for the prompt, plus a fixed reservation for the completion
+    def __init__(self, llm: AIWrapper, semaphore: TokenSemaphore, completion_tokens: int = 1024):
+        self.llm = llm
+        self.semaphore = semaphore
+        self.completion_tokens = completion_tokens
+        pass
+    def estimate(self, system_prompt: str, question: str) -> int:
+        return (len(system_prompt) + len(question)) // 4 + self.completion_tokens
+    async def get_response(self, system_prompt: str, question:str, include_thinking: bool=False) -> AIResponse:
+        tokens = await self.semaphore.acquire(self.estimate(system_prompt, question))
+        try:
+            return await self.llm.get_response(system_prompt=system_prompt, question=question, include_thinking=include_thinking)
+        finally:
+            await self.semaphore.release(tokens)
+    @property
+    def supports_batch(self) -> bool:
+        return self.llm.supports_batch
+    async def get_batch_responses(self, requests: list[tuple[str, str]], include_thinking: bool=False) -> list[AIResponse]:
+        tokens = await self.semaphore.acquire(sum(self.estimate(system_prompt, question) for system_prompt, question in requests))
+        try:
+            return await self.llm.get_batch_responses(requests, include_thinking=include_thinking)
+        finally:
+            await self.semaphore.release(tokens)
+    async def get_streaming_response(self, system_prompt: str, question:str, include_thinking: bool=False) -> Generator[str, None, None]:
+        tokens = await self.semaphore.acquire(self.estimate(system_prompt, question))
+        try:
+            async for chunk in self.llm.get_streaming_response(system_prompt=system_prompt, question=question, include_thinking=include_thinking):
+                yield chunk
+        finally:
+            await self.semaphore.release(tokens)
+
+class WorkflowManager:
+    def __init__(self, agentic_code_generator: AIWrapper, llm: AIWrapper, library: Library, max_running: int = 32,
+                 generation_tokens: int | None = None, sampling_tokens: int | None = None, per_server_limits: dict | None = None,
+                 **workflow_options):
+        self.library = library
+        self.generation_semaphore = TokenSemaphore(generation_tokens) if generation_tokens is not None else None
+        self.sampling_semaphore = TokenSemaphore(sampling_tokens) if sampling_tokens is not None else None
+        self.agentic_code_generator = LimitedAIWrapper(agentic_code_generator, self.generation_semaphore) if self.generation_semaphore is not None else agentic_code_generator
+        self.llm = LimitedAIWrapper(llm, self.sampling_semaphore) if self.sampling_semaphore is not None else llm
+        self.max_running = max_running
+        self.per_server_limits = per_server_limits or {}
+        if self.generation_semaphore is not None and workflow_options.get('candidate_generators') is not None:
+            workflow_options['candidate_generators'] = [LimitedAIWrapper(generator, self.generation_semaphore) for generator in workflow_options['candidate_generators']]
+        self.workflow_options = workflow_options
+        self.workflows = {}
+        self.running = 0
+        self.running_by_tenant = collections.Counter()
+        self.served_by_tenant = collections.Counter()
+        self.waiting = {}
+        self.wait_times = collections.deque(maxlen=1000)
+        self._sequence = itertools.count()
+        self._limits_version = None
+        self.profiles = ProfileAggregator()
+        self.speculation_wins = collections.Counter()  # candidate generator index => plans it won
+        self.speculation_rejections = collections.Counter()  # candidate generator index => candidates rejected
+        self.speculation_failures = 0  # workflows where no candidate was valid
+        pass
+    async def _admit(self, tenant: str, priority: int) -> float:
+        start = time.monotonic()
+        if self.running >= self.max_running or len(self.waiting) > 0:
+            admitted = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiting.setdefault(tenant, []), (priority, next(self._sequence), admitted))
+            try:
+                await admitted
+            except asyncio.CancelledError:
+                if admitted.done() and not admitted.cancelled():
+                    self._release(tenant) # admitted just as we were cancelled, give the slot back
+                else:
+                    self._forget(tenant, admitted)
+                raise
+        else:
+            self._start(tenant)
+        waited = time.monotonic() - start
+        self.wait_times.append(waited)
+        return waited
+    def _start(self, tenant: str) -> None:
+        self.running += 1
+        self.running_by_tenant[tenant] += 1
+        self.served_by_tenant[tenant] += 1
+        return
+    def _forget(self, tenant: str, admitted: asyncio.Future) -> None:
+        queue = [entry for entry in self.waiting.get(tenant, []) if entry[2] is not admitted]
+        heapq.heapify(queue)
+        if len(queue) > 0:
+            self.waiting[tenant] = queue
+        else:
+            self.waiting.pop(tenant, None)
+        return
+    def _release(self, tenant: str) -> None:
+        self.running -= 1
+        self.running_by_tenant[tenant] -= 1
+        while self.running < self.max_running and len(self.waiting) > 0:
+            # fair share: the tenant with the least running work goes next, ties go to whoever has been served least
+            tenant = min(self.waiting, key=lambda t: (self.running_by_tenant[t], self.served_by_tenant[t]))
+            _, _, admitted = heapq.heappop(self.waiting[tenant])
+            if len(self.waiting[tenant]) == 0:
+                del self.waiting[tenant]
+            if not admitted.done():
+                self._start(tenant)
+                admitted.set_result(True)
+        return
+    def _apply_server_limits(self) -> None:
+        if self._limits_version != self.library.catalog_version:
+            for servername, limit in self.per_server_limits.items():
+                if servername in self.library.capabilities:
+                    self.library.set_server_limit(servername, limit)
+            self._limits_version = self.library.catalog_version
+        return
+    def workflow(self, workflow_id: str) -> Workflow | None:
+        return self.workflows.get(workflow_id)
+    async def run(self, question: str, tenant: str = 'default', priority: int = 0, workflow_id: str | None = None):
+        workflow_id = workflow_id if workflow_id is not None else uuid.uuid4().hex
+        workflow = Workflow(self.agentic_code_generator, self.llm, self.library, workflow_id, **self.workflow_options)
+        self.workflows[workflow_id] = workflow
+        try:
+            waited = await self._admit(tenant, priority)
+            await logger.debug('Workflow %s for %s admitted after %.3f seconds', workflow_id, tenant, waited)
+            try:
+                async for event in workflow.generate(question):
+                    yield event
+                if workflow.speculation_stats is not None:
+                    self.speculation_rejections.update(rejected['generator'] for rejected in workflow.speculation_stats['rejected'])
+                    if workflow.speculation_stats['generator'] is None:
+                        self.speculation_failures += 1
+                    else:
+                        self.speculation_wins[workflow.speculation_stats['generator']] += 1
+                self._apply_server_limits()
+                async for event in workflow.process():
+                    yield event
+                if workflow.profiler is not None:
+                    self.profiles.add(workflow.profiler.report())
+            finally:
+                self._release(tenant)
+        finally:
+            del self.workflows[workflow_id]
+    def stats(self) -> dict:
+        waits = sorted(self.wait_times)
+        percentile = lambda q: waits[int(q * (len(waits) - 1))] if len(waits) > 0 else 0.0
+        return {'running': self.running,
+                'queued': sum(len(queue) for queue in self.waiting.values()),
+                'running_by_tenant': {tenant: count for tenant, count in self.running_by_tenant.items() if count > 0},
+                'queued_by_tenant': {tenant: len(queue) for tenant, queue in self.waiting.items()},
+                'wait_p50': percentile(0.50),
+                'wait_p95': percentile(0.95),
+                'generation_tokens': self.generation_semaphore.stats() if self.generation_semaphore is not None else None,
+                'sampling_tokens': self.sampling_semaphore.stats() if self.sampling_semaphore is not None else None,
+                'slowest_tools': self.profiles.slowest_tools(5),
+                'unavailable_servers': self.library.unavailable(),
+                'speculation_wins': dict(self.speculation_wins),
+                'speculation_rejections': dict(self.speculation_rejections),
+                'speculation_failures': self.speculation_failures,
+                'validation': self.library.validator.stats()}
@@ -4,7 +4,16 @@
 """
 
 from .Workflow import Workflow
-from .WorkflowEvent import WorkflowEventType, WorkflowEvent
+from .WorkflowEvent import WorkflowEventType, WorkflowEvent, WorkflowEventBroadcast
 from .AIWrapper import AIWrapper, AIResponse
 from .Library import Library
+from .PlanCache import PlanCache, MemoryPlanCache, SQLitePlanCache
+from .ProcessPool import ProcessPool
+from .Parallelizer import Parallelizer, ParallelPlan
+from .Profiler import Profiler, ProfileAggregator
+from .ResultCache import ResultCache, CachePolicy
+from .Sampling import Sampler
+from .ServerHealth import ServerHealth
+from .Validator import Validator, ValidationResult, ValidationError
+from .WorkflowManager import WorkflowManager, TokenSemaphore, LimitedAIWrapper
 from .Logging import get_async_logger, configure_other_logging, quiet_spammers, configure_logging
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Regression tests for the rewrite of independent MCP calls into batches.
+"""
+
+import asyncio
+import collections
+import re
+from pachinkoagentic.Flowchart import Flowchart
+from pachinkoagentic.Parallelizer import Parallelizer
+
+PLAN = '''async def plan(MCP: object):
+    a = await MCP.Server0.tool0(a=1)
+    b, c = await MCP.Server1.tool0(a=2,
+                                   b=3)
+    await MCP.Server2.tool0(a=4)
+    await MCP.Output(f"{a} {b} {c}")
+'''
+
+def test_wait_has_its_own_line():
+    plan = Parallelizer('MCP').rewrite(PLAN)
+    assert plan.code == '''async def plan(MCP: object):
+    a = MCP.Server0.tool0(a=1)
+    _wait3 = MCP.Server1.tool0(a=2,
+                                   b=3)
+    _wait5 = MCP.Server2.tool0(a=4)
+    a, (b, c), _ = await MCP.Wait(a, _wait3, _wait5)
+    await MCP.Output(f"{a} {b} {c}")
+'''
+    assert (plan.batches, plan.calls_batched, plan.critical_path_before, plan.critical_path_after) == (1, 3, 4, 2)
+
+def test_flowchart_line_ids_are_unique():
+    async def render():
+        return await (await Flowchart().from_code('plan', Parallelizer('MCP').rewrite(PLAN).code)).svg()
+    ids = collections.Counter(re.findall(r'id="(line\d+)"', asyncio.run(render())))
+    assert len(ids) > 0 and max(ids.values()) == 1, ids
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Dr. William N. Roney
+
+Regression tests for the static validation of generated plans.
+"""
+
+from pachinkoagentic.Capabilities import Capability
+from pachinkoagentic.Validator import Validator
+
+CATALOG = {'Server0': {'tool0': Capability(None, 'tool0', 'Adds a and b')}}
+
+def validate(code: str):
+    return Validator().validate(code, 'plan', CATALOG, 1)
+
+def test_valid_plan_passes():
+    result = validate('''async def plan(MCP: object):
+    t = MCP.Server0.tool0(a=1, b=2)
+    results = await MCP.Wait(t)
+    await MCP.Output(f"{results[0]}")
+''')
+    assert result.valid, str(result)
+
+def test_frame_introspection_is_rejected():
+    result = validate('''async def plan(MCP: object):
+    t = MCP.Server0.tool0(a=1, b=2)
+    g = t.get_coro().cr_frame.f_globals
+    await MCP.Output(g['sys'].modules['os'].getcwd())
+''')
+    assert not result.valid
+    assert {error.message for error in result.errors if error.kind == 'introspection'} == \
+        {'Attribute get_coro may not be accessed.', 'Attribute cr_frame may not be accessed.', 'Attribute f_globals may not be accessed.'}
+
+def test_format_fields_are_rejected():
+    result = validate('''async def plan(MCP: object):
+    t = MCP.Server0.tool0(a=1, b=2)
+    await MCP.Output('{0.cr_frame}'.format(t))
+''')
+    assert [error.kind for error in result.errors] == ['introspection']